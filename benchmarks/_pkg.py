@@ -0,0 +1,23 @@
+"""Загрузка модулей интеграции без Home Assistant.
+
+Пакет custom_components.atomenergosbyt при импорте тянет homeassistant, поэтому
+для бенчмарков регистрируем "пустой" пакет с тем же путём: модули вида
+atomsbt_lib / page_parser импортируются как обычно и разрешают свои
+относительные импорты (from . import const).
+"""
+
+import importlib
+import os
+import sys
+import types
+
+PACKAGE = "atomenergosbyt"
+PACKAGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "custom_components", PACKAGE)
+
+
+def load(module_name):
+    if PACKAGE not in sys.modules:
+        package = types.ModuleType(PACKAGE)
+        package.__path__ = [PACKAGE_DIR]
+        sys.modules[PACKAGE] = package
+    return importlib.import_module(f"{PACKAGE}.{module_name}")
@@ -0,0 +1,204 @@
+"""Латентность и пропускная способность разбора и клиента портала на локальном stand-in.
+
+    pytest benchmarks/                         # все замеры
+    pytest benchmarks/ -k parse                # только разбор
+    pytest benchmarks/ --benchmark-save=base   # сохранить базу для --benchmark-compare
+"""
+
+import asyncio
+
+import pytest
+
+import pages
+import portal
+from _pkg import load
+
+lib = load("atomsbt_lib")
+const = load("const")
+
+CARD_COUNTS = (1, 10, 100, 500)
+CONCURRENT_ACCOUNTS = 50
+
+
+@pytest.mark.parametrize("cards", CARD_COUNTS)
+def bench_parse_counter_data(benchmark, cards):
+    html = pages.check_page(cards)
+    sender = lib.AtomEnergoSender("1000")
+    benchmark.extra_info["bytes"] = len(html.encode())
+    result = benchmark(sender.parse_counter_data, html)
+    assert len(result["counters"]) == cards
+
+
+@pytest.mark.parametrize("cards", CARD_COUNTS)
+def bench_parse_streaming(benchmark, cards):
+    """Разбор частями ответа, как в клиенте: до закрытия блока карточек (lk_add_value_token уже найден)."""
+    html = pages.check_page(cards)
+    chunks = [html[start:start + lib.STREAM_CHUNK_SIZE] for start in range(0, len(html), lib.STREAM_CHUNK_SIZE)]
+
+    def parse():
+        page_parser = lib.PageParser(stop=lib.STOP_AFTER_CARDS)
+        for chunk in chunks:
+            page_parser.feed(chunk)
+            if page_parser.complete:
+                break
+        return page_parser.close()
+
+    page = benchmark(parse)
+    assert len(page.counters) == cards
+
+
+@pytest.mark.parametrize("chunk_size", (200, 500, 1000))
+def bench_parse_streaming_wrapped(benchmark, chunk_size):
+    """Карточки в колонках, токен до карточек: блока карточек нет - ответ читается до конца."""
+    html = pages.wrapped_check_page(6)
+
+    def parse():
+        page_parser = lib.PageParser(stop=lib.STOP_AFTER_CARDS)
+        for start in range(0, len(html), chunk_size):
+            page_parser.feed(html[start:start + chunk_size])
+            if page_parser.complete:
+                break
+        return page_parser.close()
+
+    page = benchmark(parse)
+    assert len(page.counters) == 6
+
+
+@pytest.mark.parametrize("use_lxml", (True, False), ids=("lxml", "html.parser"))
+@pytest.mark.parametrize("chunk_size", (1, 7))
+def bench_parse_small_chunks(benchmark, chunk_size, use_lxml):
+    """Текст, разрезанный на границах частей (посередине слова, по пробелу), разбирается как целая страница."""
+    samples = [pages.check_page(10), pages.wrapped_check_page(6)]
+    samples += [pages.alert_page(kind, markup=True) for kind in sorted(pages.ALERTS)]
+
+    def parse():
+        parsed = []
+        for html in samples:
+            # Как в клиенте: чтение прекращается, как только разбор завершён
+            page_parser = lib.PageParser(use_lxml=use_lxml, stop=lib.STOP_AFTER_CARDS)
+            for start in range(0, len(html), chunk_size):
+                page_parser.feed(html[start:start + chunk_size])
+                if page_parser.complete:
+                    break
+            parsed.append(page_parser.close())
+        return parsed
+
+    for html, page in zip(samples, benchmark(parse)):
+        expected = lib.parse_page(html, use_lxml=use_lxml)
+        assert [counter.as_dict() for counter in page.counters] == [counter.as_dict() for counter in expected.counters]
+        assert (page.alert, page.alert_text) == (expected.alert, expected.alert_text)
+        assert page.alert is not None or all(counter.previous_value for counter in page.counters)
+
+
+@pytest.mark.parametrize("kind", sorted(pages.ALERTS))
+def bench_parse_alert_page(benchmark, kind):
+    benchmark(lib.parse_page, pages.alert_page(kind))
+
+
+def _run(coroutine_factory):
+    """Новый event loop на раунд - для замеров, включающих создание соединений."""
+    return asyncio.run(coroutine_factory())
+
+
+@pytest.fixture
+def client_pool(portal_server):
+    """Пул клиентов в постоянном event loop: соединение и токены переживают раунды."""
+    loop = asyncio.new_event_loop()
+    pool = lib.AtomClientPool(max_concurrency=1, requests_per_second=0, base_url=portal_server.base_url)
+    yield loop, pool
+    loop.run_until_complete(pool.async_close())
+    loop.close()
+
+
+@pytest.mark.parametrize("cards", CARD_COUNTS)
+def bench_get_meter_id(benchmark, client_pool, cards):
+    """Обновление в установившемся режиме: keep-alive соединение и токены из кеша."""
+    loop, pool = client_pool
+    sender = pool.get_sender(f"1{cards:03d}")
+    loop.run_until_complete(sender.async_get_meter_id())  # прогрев: загрузка страницы и токенов
+
+    # Без invalidate_result() каждый следующий раунд получал бы результат прогрева (SHARED_RESULT_TTL)
+    result = benchmark(lambda: (sender.invalidate_result(), loop.run_until_complete(sender.async_get_meter_id()))[1])
+    assert len(result["counters"]) == cards
+    # Stand-in отдаёт те же карточки с новым токеном: повтор узнаётся по подписи, без разбора
+    assert sender.last_page_unchanged and sender._page_signature is not None
+
+
+@pytest.mark.parametrize("callers", (1, 8))
+def bench_get_meter_id_coalesced(benchmark, client_pool, portal_server, callers):
+    """Одновременные вызовы по одному лицевому счёту: один bootstrap/checkLs на всех."""
+    loop, pool = client_pool
+    sender = pool.get_sender("1005")
+
+    async def refresh_all():
+        return await asyncio.gather(*(sender.async_get_meter_id() for _ in range(callers)))
+
+    def refresh():
+        sender.invalidate_tokens()
+        sender.invalidate_result()
+        before = dict(portal_server.stand_in.requests)
+        results = loop.run_until_complete(refresh_all())
+        return results, {key: portal_server.stand_in.requests[key] - before[key] for key in before}
+
+    results, requests = benchmark(refresh)
+    assert all(result is results[0] for result in results)
+    assert requests["bootstrap"] == 1 and requests["checkLs"] == 1
+
+
+def bench_get_meter_id_cold(benchmark, portal_server):
+    """Блокирующая обёртка: новое соединение, загрузка страницы и checkLs на каждый вызов."""
+    sender = lib.AtomEnergoSender("1010", base_url=portal_server.base_url)
+    result = benchmark(lambda: (sender.invalidate_tokens(), sender.invalidate_result(), sender.get_meter_id())[2])
+    assert len(result["counters"]) == 10
+
+
+@pytest.mark.parametrize("kind", sorted(pages.ALERTS))
+def bench_get_meter_id_alert(benchmark, client_pool, kind):
+    loop, pool = client_pool
+    prefix = {value: key for key, value in portal.ALERT_PREFIXES.items()}[kind]
+    sender = pool.get_sender(f"{prefix}000")
+    result = benchmark(lambda: loop.run_until_complete(sender.async_get_meter_id()))
+    assert "meter_id" in result
+
+
+@pytest.mark.parametrize("concurrency", (1, 4, 16))
+def bench_get_meter_id_throughput(benchmark, portal_server, concurrency):
+    """CONCURRENT_ACCOUNTS лицевых счетов через общий пул; ops/s в extra_info."""
+    accounts = [f"{2000 + index}{index % 20 + 1:03d}" for index in range(CONCURRENT_ACCOUNTS)]
+
+    async def refresh_all():
+        pool = lib.AtomClientPool(max_concurrency=concurrency, requests_per_second=0, base_url=portal_server.base_url)
+        try:
+            return await asyncio.gather(*(pool.get_sender(ls).async_get_meter_id() for ls in accounts))
+        finally:
+            await pool.async_close()
+
+    results = benchmark(_run, refresh_all)
+    assert all("counters" in result for result in results)
+    if benchmark.stats:  # None при --benchmark-disable
+        benchmark.extra_info["accounts_per_second"] = CONCURRENT_ACCOUNTS / benchmark.stats.stats.mean
+
+
+@pytest.mark.parametrize("counters", (1, 3, 12))
+def bench_send_reading(benchmark, client_pool, counters):
+    """Передача показаний по всем счётчикам лицевого счёта одним запросом."""
+    loop, pool = client_pool
+    sender = pool.get_sender(f"3{counters:03d}")
+    data = loop.run_until_complete(sender.async_get_meter_id())
+    readings = [(counter, [counter.previous_reading + 1]) for counter in data["counters"]]
+
+    results = benchmark(lambda: loop.run_until_complete(sender.async_send_readings(readings)))
+    assert len(results) == counters and all(result.accepted for result in results.values())
+
+
+def bench_send_reading_invalid(benchmark, client_pool, portal_server):
+    """Показания меньше предыдущих отклоняются до запроса к порталу."""
+    loop, pool = client_pool
+    sender = pool.get_sender("3003")
+    data = loop.run_until_complete(sender.async_get_meter_id())
+    readings = [(counter, [counter.previous_reading - 1]) for counter in data["counters"]]
+    before = portal_server.stand_in.requests["add"]
+
+    results = benchmark(lambda: loop.run_until_complete(sender.async_send_readings(readings)))
+    assert all(result.reason == const.REASON_LESS_THAN_PREVIOUS for result in results.values())
+    assert portal_server.stand_in.requests["add"] == before
@@ -0,0 +1,143 @@
+"""Сравнение однопроходного page_parser с прежним разбором через BeautifulSoup.
+
+Запуск из корня репозитория:
+
+    python benchmarks/compare_parsers.py                     # сгенерированные страницы
+    python benchmarks/compare_parsers.py counter_page.html   # сохранённые ответы портала
+
+Прежний разбор воспроизведён так, как его выполнял get_meter_id: parse_counter_data
+(первый BeautifulSoup) и поиск сообщений по всем div (второй BeautifulSoup).
+"""
+
+import argparse
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+import pages
+from _pkg import load
+
+page_parser = load("page_parser")
+
+STREAM_CHUNK_SIZES = (200, 500, 1000)
+
+
+def legacy_parse(html_content):
+    soup = BeautifulSoup(html_content, 'html.parser')
+    counters = []
+    for card in soup.find_all("div", class_="card")[1:]:
+        counter = {"name": None, "zavod_nomer": None, "previous_value": None, "fields": {}}
+        strong_tag = card.find("strong")
+        if strong_tag:
+            counter_name = strong_tag.get_text(strip=True)
+            if counter_name.endswith("."):
+                counter_name = counter_name[:len(counter_name) - 1]
+            counter["name"] = counter_name
+        for h2 in card.find_all("h2"):
+            if "№" in h2.text:
+                counter["zavod_nomer"] = h2.get_text(strip=True).split("№")[-1].strip()
+                break
+        for fr in card.find_all("div", class_="float-right"):
+            if "Предыдущее показание" in fr.get_text(strip=True):
+                value_div = fr.find("div")
+                if value_div:
+                    match = re.search(r'\d+', value_div.get_text(strip=True))
+                    if match:
+                        counter["previous_value"] = match.group(0)
+                break
+        for input_field in card.find_all("input"):
+            name = input_field.get("name")
+            if name:
+                counter["fields"][name] = input_field.get("value", "")
+        counters.append(counter)
+    service_tokens = {}
+    token_input = soup.find("input", {"name": "lk_add_value_token"})
+    if token_input:
+        service_tokens["lk_add_value_token"] = token_input.get("value")
+
+    alert = None
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for div in soup.find_all('div'):
+        ' '.join(div.get_text().split())  # строка для лога на каждый div
+        for message, code in page_parser.ALERT_MESSAGES:
+            if div.get_text(strip=True).startswith(message):
+                alert = code
+                break
+        if alert:
+            break
+    return {"counters": counters, "service_tokens": service_tokens}, alert
+
+
+def _candidates():
+    yield "single-pass (lxml)" if page_parser._lxml_parser_factory() else "single-pass (html.parser)", \
+        lambda html: page_parser.parse_page(html)
+    if page_parser._lxml_parser_factory():
+        yield "single-pass (html.parser)", lambda html: page_parser.parse_page(html, use_lxml=False)
+
+
+def _streamed(html, chunk_size):
+    """Разбор частями с досрочной остановкой, как в клиенте."""
+    parser = page_parser.PageParser(stop=page_parser.STOP_AFTER_CARDS)
+    for start in range(0, len(html), chunk_size):
+        parser.feed(html[start:start + chunk_size])
+        if parser.complete:
+            break
+    return parser.close()
+
+
+def _check(name, html, alert=None):
+    """alert - ожидаемый код сообщения там, где прежний разбор его не находил."""
+    expected, expected_alert = legacy_parse(html)
+    expected_alert = alert or expected_alert
+    candidates = list(_candidates())
+    candidates += [(f"streamed ({size})", lambda html, size=size: _streamed(html, size)) for size in STREAM_CHUNK_SIZES]
+    for label, parse in candidates:
+        page = parse(html)
+        counters = [counter.as_dict() for counter in page.counters]
+        for counter in counters:
+            counter.pop("value_fields")  # В прежнем разборе этого ключа не было
+            if counter["previous_value"]:
+                # Прежний разбор отбрасывал дробную часть показания
+                counter["previous_value"] = re.match(r"\d+", counter["previous_value"]).group(0)
+        if {**page.as_dict(), "counters": counters} != expected or page.alert != expected_alert:
+            sys.exit(f"{name}: результат '{label}' расходится с прежним разбором")
+
+
+def _bench(name, html, number):
+    legacy = min(timeit.repeat(lambda: legacy_parse(html), number=number, repeat=3)) / number
+    print(f"{name:<28} {len(html) / 1024:>8.1f} KiB   legacy {legacy * 1000:>9.3f} ms")
+    for label, parse in _candidates():
+        elapsed = min(timeit.repeat(lambda: parse(html), number=number, repeat=3)) / number
+        print(f"{'':<28} {'':>12}   {label:<26} {elapsed * 1000:>9.3f} ms  x{legacy / elapsed:.1f}")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("files", nargs="*", help="сохранённые страницы (counter_page.html)")
+    arg_parser.add_argument("-n", "--number", type=int, default=20, help="повторов на замер")
+    args = arg_parser.parse_args()
+
+    if args.files:
+        samples = []
+        for path in args.files:
+            with open(path, encoding="utf-8") as f:
+                samples.append((path, f.read()))
+    else:
+        samples = [(f"alert:{kind}", pages.alert_page(kind)) for kind in pages.ALERTS]
+        samples += [(f"checkLs:{count} cards", pages.check_page(count)) for count in (1, 10, 100, 500)]
+        samples.append(("checkLs:6 cards in columns", pages.wrapped_check_page(6)))
+
+    for name, html in samples:
+        _check(name, html)
+        _bench(name, html, args.number)
+    if not args.files:
+        # Сообщение с разметкой внутри: прежний разбор склеивал слова (get_text(strip=True)) и его пропускал
+        for kind, text in pages.ALERTS.items():
+            code = next(code for message, code in page_parser.ALERT_MESSAGES if text.startswith(message))
+            _check(f"alert:{kind} (markup)", pages.alert_page(kind, markup=True), code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import portal  # noqa: E402
+
+
+class _PortalThread:
+    """Stand-in портала в отдельном потоке со своим event loop."""
+
+    def __init__(self, stand_in):
+        self.stand_in = stand_in
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+        self.runner, self.base_url = asyncio.run_coroutine_threadsafe(portal.start(stand_in), self.loop).result()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture(scope="session")
+def portal_server():
+    server = _PortalThread(portal.PortalStandIn())
+    yield server
+    server.close()
@@ -0,0 +1,134 @@
+"""Время импорта модулей интеграции и её настройки (без запросов к порталу).
+
+Каждый замер - в отдельном интерпретаторе, берётся минимум из нескольких повторов.
+Кроме времени проверяется, что импорт не имеет побочных эффектов: не загружает lxml,
+не запускает потоки и не создаёт файлов.
+
+    python benchmarks/import_time.py [--repeat 5]
+
+Если установлен Home Assistant, дополнительно замеряется импорт пакета и платформ
+custom_components.atomenergosbyt поверх уже загруженного ядра HA (как при старте).
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+LIB_MODULES = ("models", "page_parser", "scheduler", "atomsbt_lib")
+
+# Модули, которые HA загружает раньше интеграции (ядро, sensor, recorder)
+HA_PRELOAD = (
+    "homeassistant.core",
+    "homeassistant.config_entries",
+    "homeassistant.components.sensor",
+    "homeassistant.components.recorder",
+    "homeassistant.helpers.update_coordinator",
+)
+HA_MODULES = (
+    "custom_components.atomenergosbyt",
+    "custom_components.atomenergosbyt.sensor",
+    "custom_components.atomenergosbyt.config_flow",
+)
+
+_MEASURE = """
+import json, os, sys, threading, time
+sys.path[:0] = {path!r}
+{importer_setup}
+for name in {preload!r}:
+    __import__(name)
+files = set(os.listdir({package_dir!r}))
+threads = threading.active_count()
+modules = set(sys.modules)
+start = time.perf_counter()
+for name in {modules!r}:
+    {importer}(name)
+import_time = time.perf_counter() - start
+result = {{
+    "import": import_time,
+    "modules": len(set(sys.modules) - modules),
+    "lxml": "lxml.etree" in sys.modules,
+    "threads": threading.active_count() - threads,
+    "files": sorted(set(os.listdir({package_dir!r})) - files),
+}}
+{setup}
+print(json.dumps(result))
+"""
+
+# Настройка клиента без сети: пул, клиент лицевого счёта, журнал
+_SETUP = """
+lib = sys.modules["atomenergosbyt.atomsbt_lib"]
+start = time.perf_counter()
+pool = lib.AtomClientPool()
+pool.get_sender("3003")
+lib.setup_logging("info")
+result["setup"] = time.perf_counter() - start
+"""
+
+
+def _measure(modules, preload=(), setup="", ha=False):
+    """ha=False - модули пакета без Home Assistant (через _pkg), иначе - custom_components."""
+    code = _MEASURE.format(
+        path=[REPO_DIR] if ha else [BENCH_DIR],
+        importer_setup="" if ha else "import _pkg",
+        importer="__import__" if ha else "_pkg.load",
+        preload=list(preload),
+        modules=list(modules),
+        package_dir=os.path.join(REPO_DIR, "custom_components", "atomenergosbyt"),
+        setup=setup,
+    )
+    with tempfile.TemporaryDirectory() as cwd:
+        output = subprocess.run([sys.executable, "-c", code], cwd=cwd, check=True, capture_output=True, text=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def _best(runs, key):
+    return min(run[key] for run in runs)
+
+
+def _report(label, runs):
+    side_effects = []
+    if runs[0]["lxml"]:
+        side_effects.append("lxml")
+    if runs[0]["threads"]:
+        side_effects.append(f"потоки: {runs[0]['threads']}")
+    if runs[0]["files"]:
+        side_effects.append(f"файлы: {', '.join(runs[0]['files'])}")
+    line = f"{label:<56} {_best(runs, 'import') * 1000:>8.1f} ms  {runs[0]['modules']:>4} модулей"
+    if "setup" in runs[0]:
+        line += f"   настройка {_best(runs, 'setup') * 1000:.2f} ms"
+    print(line + (f"   побочные эффекты: {'; '.join(side_effects)}" if side_effects else ""))
+    return not side_effects
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    args = arg_parser.parse_args()
+
+    clean = True
+    for module in LIB_MODULES:
+        runs = [_measure([module]) for _ in range(args.repeat)]
+        clean &= _report(f"atomenergosbyt.{module}", runs)
+
+    runs = [_measure(["atomsbt_lib"], setup=_SETUP) for _ in range(args.repeat)]
+    _report("atomsbt_lib + AtomClientPool/get_sender/setup_logging", runs)
+
+    try:
+        import homeassistant  # noqa: F401
+    except ImportError:
+        print("Home Assistant не установлен - замер импорта пакета интеграции пропущен")
+    else:
+        runs = [_measure(HA_MODULES, preload=HA_PRELOAD, ha=True) for _ in range(args.repeat)]
+        clean &= _report("custom_components.atomenergosbyt (+ sensor, config_flow)", runs)
+
+    if not clean:
+        sys.exit("Импорт модулей интеграции имеет побочные эффекты")
+
+
+if __name__ == "__main__":
+    main()
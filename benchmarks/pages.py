@@ -0,0 +1,101 @@
+"""Генератор страниц counters.php по образцу ответов lkfl.atomsbt.ru."""
+
+SERVICES = (
+    ("Электроснабжение", "кВт*ч"),
+    ("Холодное водоснабжение", "м³"),
+    ("Горячее водоснабжение", "м³"),
+)
+
+ALERTS = {
+    "period": "Занесение показаний возможно с 5 по 25 число каждого месяца.",
+    "not_found": "Лицевой счет не найден.",
+    "check_error": "Ошибка проверки лицевого счета. Повторите попытку позднее.",
+    "no_counters": "Отсутствуют счётчики для занесения показаний.",
+}
+
+
+def bootstrap_page(csrf_token="csrf-0123456789abcdef", lk_token="lk-0123456789abcdef"):
+    """Первая страница: csrf-мета и скрытое поле lk_add_value_token."""
+    return f"""<!DOCTYPE html>
+<html lang="ru">
+<head>
+<meta charset="utf-8">
+<meta name="csrf-token-value" content="{csrf_token}">
+<title>Передача показаний</title>
+<script>var messages = {{"notFound": "Лицевой счет не найден"}};</script>
+</head>
+<body>
+<div class="container">
+  <form id="lk_form" method="post">
+    <input type="hidden" name="lk_add_value_token" value="{lk_token}">
+    <div class="form-group"><label>Лицевой счёт</label><input type="text" name="ls" value=""></div>
+  </form>
+</div>
+</body>
+</html>
+"""
+
+
+def counter_card(index, counter_id=None, tariffs=1, previous_value=None, date_pok="25.09.2026"):
+    """Карточка одного счётчика с полным набором скрытых полей."""
+    counter_id = counter_id if counter_id is not None else 100000 + index
+    service, unit = SERVICES[index % len(SERVICES)]
+    previous_value = previous_value if previous_value is not None else f"{1000 + index * 7}.{index % 100:02d}"
+    values = "".join(
+        f'<input type="text" class="form-control" name="counters[{counter_id}][value{zone}]" value="">'
+        for zone in range(1, tariffs + 1)
+    )
+    return f"""
+<div class="card mb-3">
+  <div class="card-header"><strong>{service}.</strong></div>
+  <div class="card-body">
+    <h2 class="h5">Счётчик № {40000000 + index}</h2>
+    <div class="float-left">Дата последних показаний: {date_pok}</div>
+    <div class="float-right">Предыдущее показание <div class="value">{previous_value} {unit}</div></div>
+    <input type="hidden" name="counters[{counter_id}][DatePok]" value="{date_pok}">
+    <input type="hidden" name="counters[{counter_id}][check_avg]" value="{150 + index}">
+    <input type="hidden" name="counters[{counter_id}][Tarifnost]" value="{tariffs}">
+    <input type="hidden" name="counters[{counter_id}][NomerUslugi]" value="{index % 3 + 1}">
+    <input type="hidden" name="counters[{counter_id}][NazvanieTarifa]" value="Однотарифный">
+    <input type="hidden" name="counters[{counter_id}][ZavodNomer]" value="{40000000 + index}">
+    {values}
+  </div>
+</div>"""
+
+
+def check_page(counters=3, lk_token="lk-fedcba9876543210", tariffs=1):
+    """Ответ checkLs с карточками счётчиков (первая карточка - сведения о ЛС)."""
+    cards = "".join(counter_card(index, tariffs=tariffs) for index in range(counters))
+    return f"""<div class="counters">
+<div class="card"><div class="card-body"><strong>Лицевой счёт</strong> <span>ул. Примерная, д. 1</span></div></div>
+{cards}
+<input type="hidden" name="lk_add_value_token" value="{lk_token}">
+<div class="text-right"><button type="submit" class="btn btn-primary">Передать показания</button></div>
+</div>
+"""
+
+
+def wrapped_check_page(counters=6, lk_token="lk-fedcba9876543210"):
+    """Ответ checkLs, где каждая карточка - в своей колонке (div.row > div.col-md-6 > div.card), токен - до карточек."""
+    cards = "".join(f'<div class="col-md-6">{counter_card(index)}</div>' for index in range(counters))
+    return f"""<input type="hidden" name="lk_add_value_token" value="{lk_token}">
+<div class="card"><div class="card-body"><strong>Лицевой счёт</strong> <span>ул. Примерная, д. 1</span></div></div>
+<div class="row">{cards}</div>
+<div class="text-right"><button type="submit" class="btn btn-primary">Передать показания</button></div>
+"""
+
+
+def alert_page(kind, markup=False):
+    """Ответ checkLs с сообщением портала вместо карточек; markup - первое слово в <strong> и перенос строки."""
+    text = ALERTS[kind]
+    if markup:
+        first, rest = text.split(" ", 1)
+        text = f"<strong>{first}</strong><br>\n{rest}"
+    return f'<div class="alert alert-danger" role="alert">{text}</div>\n'
+
+
+def add_response(accepted=True):
+    """Ответ на передачу показаний (action=add)."""
+    if accepted:
+        return '<div class="alert alert-success">Показания успешно переданы.</div>'
+    return '<div class="alert alert-danger">Показания не приняты: значение меньше предыдущего.</div>'
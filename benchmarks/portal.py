@@ -0,0 +1,124 @@
+"""Локальная замена lkfl.atomsbt.ru: сценарий counters.php без обращения к порталу.
+
+    GET  /lk_auth/counters.php   - страница с csrf-метой и полем lk_add_value_token (+ cookie сессии)
+    POST action=checkLs          - карточки счётчиков или одно из сообщений портала
+    POST action=add              - ответ на передачу показаний
+
+Сценарий ответа на checkLs задаётся по номеру лицевого счёта (accounts), по умолчанию -
+карточки: число карточек = последние три цифры ЛС (0 -> 3). Сообщения портала:
+ЛС, начинающийся с "9001" - вне периода 5-25, "9002" - не найден, "9003" - ошибка проверки,
+"9004" - нет счётчиков.
+
+Отдельный запуск (для ручной проверки интеграции или CLI):
+
+    python benchmarks/portal.py --port 8080 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import secrets
+
+from aiohttp import web
+
+import pages
+
+COUNTERS_PATH = "/lk_auth/counters.php"
+SESSION_COOKIE = "PHPSESSID"
+ALERT_PREFIXES = {
+    "9001": "period",
+    "9002": "not_found",
+    "9003": "check_error",
+    "9004": "no_counters",
+}
+
+
+class PortalStandIn:
+    def __init__(self, accounts=None, latency=0.0):
+        self.accounts = dict(accounts or {})
+        self.latency = latency
+        self.sessions = {}   # id сессии -> (csrf, lk)
+        self.requests = {"bootstrap": 0, "checkLs": 0, "add": 0, "rejected": 0}
+        self.submissions = []
+
+    def scenario(self, ls):
+        if ls in self.accounts:
+            return self.accounts[ls]
+        alert = ALERT_PREFIXES.get(ls[:4])
+        if alert:
+            return alert
+        return int(ls[-3:] or 0) or 3
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get(COUNTERS_PATH, self.handle_bootstrap)
+        app.router.add_post(COUNTERS_PATH, self.handle_post)
+        return app
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _issue_tokens(self, session_id):
+        tokens = (secrets.token_hex(16), secrets.token_hex(16))
+        self.sessions[session_id] = tokens
+        return tokens
+
+    async def handle_bootstrap(self, request):
+        await self._delay()
+        self.requests["bootstrap"] += 1
+        session_id = secrets.token_hex(8)
+        csrf_token, lk_token = self._issue_tokens(session_id)
+        response = web.Response(text=pages.bootstrap_page(csrf_token, lk_token), content_type="text/html")
+        response.set_cookie(SESSION_COOKIE, session_id)
+        return response
+
+    async def handle_post(self, request):
+        await self._delay()
+        form = await request.post()
+        session_id = request.cookies.get(SESSION_COOKIE)
+        tokens = self.sessions.get(session_id)
+        if tokens is None or form.get("csrftoken") != tokens[0] or form.get("lk_add_value_token") != tokens[1]:
+            self.requests["rejected"] += 1
+            return web.Response(status=419, text="CSRF token mismatch")
+
+        action = form.get("action")
+        if action == "checkLs":
+            self.requests["checkLs"] += 1
+            scenario = self.scenario(form.get("ls", ""))
+            if isinstance(scenario, str):
+                text = pages.alert_page(scenario)
+            else:
+                # Страница с карточками содержит новый lk_add_value_token - прежний больше не принимается
+                lk_token = secrets.token_hex(16)
+                self.sessions[session_id] = (tokens[0], lk_token)
+                text = pages.check_page(scenario, lk_token=lk_token)
+        elif action == "add":
+            self.requests["add"] += 1
+            self.submissions.append({key: value for key, value in form.items() if key.endswith("]") or key == "ls"})
+            text = pages.add_response(accepted=True)
+        else:
+            return web.Response(status=400, text="Unknown action")
+        return web.Response(text=text, content_type="text/html")
+
+
+async def start(portal, host="127.0.0.1", port=0):
+    """Запускает stand-in в текущем event loop; возвращает (runner, base_url)."""
+    runner = web.AppRunner(portal.app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{bound_port}"
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Локальная замена lkfl.atomsbt.ru")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8080)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, секунд")
+    args = arg_parser.parse_args()
+    web.run_app(PortalStandIn(latency=args.latency).app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,109 @@
 from homeassistant.core import HomeAssistant
 from homeassistant.config_entries import ConfigEntry
-from .const import DOMAIN, CONF_LS_NUMBER, CONF_COUNTERS_DATA
+import voluptuous as vol
+from homeassistant.helpers.start import async_at_started
+from .const import (
+    DOMAIN, CONF_LS_NUMBER, CONF_COUNTERS, CONF_COUNTERS_DATA, DATA_COORDINATOR, DATA_OPTIONS,
+    CONF_LOG_LEVEL, DEFAULT_LOG_LEVEL, LOG_LEVEL_OPTIONS,
+    CONF_MAX_CONCURRENCY, CONF_REQUESTS_PER_SECOND, DEFAULT_MAX_CONCURRENCY, DEFAULT_REQUESTS_PER_SECOND,
+)
+from .atomsbt_lib import setup_logging
+from .coordinator import AtomEnergoCoordinator, get_client_pool
+from .history import ReadingHistory
+from .models import Counter
+from .outbox import ReadingOutbox
+from .services import async_setup_services
 
 PLATFORMS = ["sensor"]
 
+# Необязательные общие настройки в configuration.yaml:
+# atomenergosbyt:
+#   max_concurrent_requests: 4
+#   requests_per_second: 2
+CONFIG_SCHEMA = vol.Schema({
+    DOMAIN: vol.Schema({
+        vol.Optional(CONF_MAX_CONCURRENCY, default=DEFAULT_MAX_CONCURRENCY): vol.All(vol.Coerce(int), vol.Range(min=1, max=32)),
+        vol.Optional(CONF_REQUESTS_PER_SECOND, default=DEFAULT_REQUESTS_PER_SECOND): vol.All(vol.Coerce(float), vol.Range(min=0)),
+    })
+}, extra=vol.ALLOW_EXTRA)
+
+async def async_setup(hass: HomeAssistant, config) -> bool:
+    """Общий пул клиентов портала и регистрация сервисов интеграции."""
+    get_client_pool(hass, config.get(DOMAIN))
+    await async_setup_services(hass)
+    return True
+
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
-    """Сохраняем номер счёта в глобальные данные HA."""
+    """Сохраняем номер счёта и координатор обновления в глобальные данные HA.
+
+    Портал при запуске не опрашивается: сенсоры создаются по счётчикам из записи и
+    восстанавливают последнее состояние, первый запрос уходит в фоне после старта HA.
+    """
+    setup_logging(_log_level(hass))
+    ls_number = entry.data.get(CONF_LS_NUMBER)
+    coordinator = AtomEnergoCoordinator(hass, entry)
+    await coordinator.async_load_history()
+    # При выгрузке - последним, после отписки слушателей: отложенная запись Store иначе может выполниться
+    # после удаления файлов (async_remove_entry) или загрузки их новым координатором при перезагрузке
+    entry.async_on_unload(coordinator.async_save_history)
+
     hass.data.setdefault(DOMAIN, {})
     hass.data[DOMAIN][entry.entry_id] = {
-        CONF_LS_NUMBER: entry.data.get(CONF_LS_NUMBER),
-        CONF_COUNTERS_DATA: entry.data.get(CONF_COUNTERS_DATA),
+        CONF_LS_NUMBER: ls_number,
+        DATA_COORDINATOR: coordinator,
+        DATA_OPTIONS: dict(entry.options),
     }
     
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
+    entry.async_on_unload(entry.add_update_listener(async_reload_entry))
+    entry.async_on_unload(coordinator.async_track_midnight())
+    if coordinator.outbox.enabled:
+        entry.async_on_unload(coordinator.outbox.async_start(coordinator.async_request_refresh))
+
+    async def _async_first_refresh(hass: HomeAssistant) -> None:
+        entry.async_create_background_task(
+            hass, coordinator.async_refresh(), f"{DOMAIN}_first_refresh_{ls_number}"
+        )
+
+    entry.async_on_unload(async_at_started(hass, _async_first_refresh))
+    return True
+
+async def async_reload_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Перезагрузка записи после изменения настроек (новые счётчики в data перезагрузки не требуют)."""
+    if hass.data[DOMAIN][entry.entry_id][DATA_OPTIONS] != dict(entry.options):
+        await hass.config_entries.async_reload(entry.entry_id)
+
+async def async_migrate_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
+    """Версия 1 хранила весь разбор страницы (поля форм, токены) - оставляем идентификаторы счётчиков."""
+    if entry.version == 1:
+        snapshot = entry.data.get(CONF_COUNTERS_DATA) or {}
+        hass.config_entries.async_update_entry(
+            entry,
+            data={
+                CONF_LS_NUMBER: entry.data.get(CONF_LS_NUMBER),
+                CONF_COUNTERS: [Counter.from_dict(counter).as_entry_data() for counter in snapshot.get("counters", [])],
+            },
+            version=2,
+        )
     return True
     
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Удаление записи конфигурации."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
-    return unload_ok
\ No newline at end of file
+        data = hass.data[DOMAIN].pop(entry.entry_id)
+        get_client_pool(hass).release_sender(data[CONF_LS_NUMBER])
+    return unload_ok
+
+async def async_remove_entry(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    """Удаление записи: удаляем и сохранённую историю показаний, и очередь передачи."""
+    await ReadingHistory(hass, entry).async_remove()
+    await ReadingOutbox(hass, entry).async_remove()
+
+def _log_level(hass: HomeAssistant) -> str:
+    """Уровень логирования общий для интеграции - берём самый подробный из настроек записей."""
+    levels = [
+        entry.options.get(CONF_LOG_LEVEL, DEFAULT_LOG_LEVEL)
+        for entry in hass.config_entries.async_entries(DOMAIN)
+    ]
+    return min(levels, key=LOG_LEVEL_OPTIONS.index, default=DEFAULT_LOG_LEVEL)
@@ -1,274 +1,815 @@
-import requests
-import urllib3
+import aiohttp
+import asyncio
+import atexit
+import codecs
+import contextlib
+import functools
 import logging
+import math
 import os
-import re
-from bs4 import BeautifulSoup
-from datetime import datetime
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import time
+from dataclasses import dataclass
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from yarl import URL
 from . import const
+from .capture import ResponseCapture
+from .metrics import CACHE_PAGE, CACHE_SHARED, CACHE_TOKENS, PHASE_BOOTSTRAP, PHASE_CHECK_LS, PHASE_PARSE, PHASE_SEND, ClientMetrics
+from .models import parse_number
+from .page_parser import (
+    STOP_AFTER_CARDS, STOP_AFTER_TOKENS, PageParser, SignedPageParser, find_service_token, parse_page, parse_submission_reply,
+)
+
+_LOGGER = logging.getLogger(__name__)
 
 # --- Настройка логирования ---
-LOG_DIR = '/config/custom_components/atomenergosbyt'
-LOG_FILE_PATH = os.path.join(LOG_DIR, '_atomsbt.log')
+# Все модули интеграции пишут в логгер пакета. Файл _atomsbt.log пишет фоновый поток
+# QueueListener: вызывающий код (в т.ч. event loop) только кладёт запись в очередь.
+LOG_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '_atomsbt.log')
+LOG_LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "error": logging.ERROR,
+}
 
-os.makedirs(LOG_DIR, exist_ok=True)
-logger = logging.getLogger("kolatom_logger")
-logger.setLevel(logging.DEBUG)
+_log_listener = None
+
+
+def setup_logging(level: str = const.DEFAULT_LOG_LEVEL):
+    """Задаёт уровень логирования интеграции и (один раз) запускает фоновую запись в файл."""
+    global _log_listener
+    package_logger = logging.getLogger(__package__)
+    package_logger.setLevel(LOG_LEVELS.get(level, logging.INFO))
+    if _log_listener is not None:
+        return
+
+    handler = RotatingFileHandler(
+        LOG_FILE_PATH,
+        maxBytes=100 * 1024 * 1024,  # 100 МБ
+        backupCount=5,  # 5 резервных копий
+        encoding='utf-8',
+        delay=True  # Файл открывается уже в потоке записи
+    )
+    handler.setFormatter(logging.Formatter('[%(asctime)s] %(levelname)s %(message)s', datefmt='%d.%m.%Y %H:%M:%S'))
+
+    log_queue = queue.SimpleQueue()
+    _log_listener = QueueListener(log_queue, handler)
+    package_logger.addHandler(QueueHandler(log_queue))
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+BASE_URL = "https://lkfl.atomsbt.ru"
+COUNTERS_PATH = "/lk_auth/counters.php?source=ABINTERNETBR"
+COUNTERS_URL = f"{BASE_URL}{COUNTERS_PATH}"
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
+    'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin'
+}
+
+# Таймауты запросов (секунды)
+GET_TIMEOUT = 10
+POST_TIMEOUT = 15
+
+# Потоковое чтение страниц: части по 16 КиБ, не более 4 МиБ на ответ. После того как разбор
+# завершён досрочно, остаток до 64 КиБ дочитывается (соединение остаётся keep-alive), больший -
+# не читается, соединение закрывается.
+STREAM_CHUNK_SIZE = 16 * 1024
+MAX_RESPONSE_BYTES = 4 * 1024 * 1024
+DRAIN_LIMIT = 64 * 1024
+
+# HTTP-статусы, которыми портал отвечает на устаревший csrf/lk-токен
+TOKEN_REJECTED_STATUSES = (401, 403, 419)
+
+# Повторы временных сбоев: 3 попытки, задержка ~1 с, 2 с ... (не более 8 с), полный джиттер
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+TRANSIENT_STATUSES = (429, 500, 502, 503, 504)
+
+# Circuit breaker: после 3 неудачных запросов подряд хост считается недоступным на 60 с
+# (с каждой неудачной пробой - вдвое дольше, до 15 мин)
+CIRCUIT_FAILURE_THRESHOLD = 3
+CIRCUIT_RESET_TIMEOUT = 60.0
+CIRCUIT_MAX_RESET_TIMEOUT = 15 * 60.0
+
+# Одновременные checkLs по одному лицевому счёту выполняются одним запросом; успешный
+# результат ещё столько секунд отдаётся без запроса (всплески при старте HA и перезагрузке записей)
+SHARED_RESULT_TTL = 10.0
+
+# Проверка перед передачей: потребление больше среднего (check_avg) во столько раз - ошибка ввода
+AVERAGE_LIMIT_FACTOR = 10
+
+
+class PortalUnavailableError(Exception):
+    """Портал недоступен: circuit breaker разомкнут, запрос не выполнялся."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Портал недоступен, повтор через {retry_after:.0f} с")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Размыкается после серии неудач и пропускает одну пробу по истечении таймаута."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                 max_reset_timeout=CIRCUIT_MAX_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.reset_timeout = reset_timeout
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+    @property
+    def retry_after(self):
+        """Секунд до следующей пробы (0, если запросы разрешены)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if self.retry_after > 0:
+                raise PortalUnavailableError(self.retry_after)
+            self.state = self.HALF_OPEN  # Этот запрос - проба
+            self._probe_started = time.monotonic()
+        elif self.state == self.HALF_OPEN:
+            # Проба уже выполняется; зависшая (отменённая) проба не блокирует дольше reset_timeout
+            waited = time.monotonic() - self._probe_started
+            if waited < self.reset_timeout:
+                raise PortalUnavailableError(self.reset_timeout - waited)
+            self._probe_started = time.monotonic()
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            _LOGGER.info("Портал снова доступен")
+        self.state = self.CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+        elif self.failures < self.failure_threshold:
+            return
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        _LOGGER.warning("Портал недоступен (%s неудачных запросов подряд), следующая проба через %.0f с", self.failures, self.reset_timeout)
+
+
+class CircuitBreakers(dict):
+    """CircuitBreaker по имени хоста."""
+
+    def __missing__(self, host):
+        breaker = self[host] = CircuitBreaker()
+        return breaker
+
+    def get(self, host):
+        return self[host]
+
+
+def retry_delay(attempt):
+    """Экспоненциальная задержка перед повтором с полным джиттером."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
 
-handler = RotatingFileHandler(
-    LOG_FILE_PATH,
-    maxBytes=100 * 1024 * 1024,  # 100 МБ
-    backupCount=5  # 5 резервных копий
-)
-formatter = logging.Formatter('[%(asctime)s] %(message)s', datefmt='%d.%m.%Y %H:%M:%S')
-handler.setFormatter(formatter)
 
-# Чтобы не добавлять несколько обработчиков при повторном импорте
-if not logger.handlers:
-    logger.addHandler(handler)
+def _is_transient_error(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in TRANSIENT_STATUSES
+    return isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError))
 
-# --- Функция для логирования ---
-def custom_log(message: str):
-    logger.info(message)
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+def _can_retry(error, phase):
+    """Передача показаний (action=add) не идемпотентна: повторяется, только если соединение не установлено.
+
+    После таймаута или обрыва при чтении ответа портал мог уже принять показания.
+    """
+    return phase != PHASE_SEND or isinstance(error, aiohttp.ClientConnectorError)
+
+
+@dataclass
+class SubmissionResult:
+    """Результат передачи показаний одного счётчика."""
+    counter_id: str
+    accepted: bool | None           # None - приём не подтверждён (const.REASON_UNCONFIRMED)
+    reason: str | None = None       # const.REASON_* при отказе
+    message: str | None = None      # Сообщение портала из ответа
+
+    def as_dict(self):
+        return {"accepted": self.accepted, "reason": self.reason, "message": self.message}
+
+
+def validate_reading(counter, values, check_plausibility=True):
+    """Причина (const.REASON_*), по которой показания нельзя передавать, или None.
+
+    Число показаний должно совпадать с полями ввода и Tarifnost карточки, показания - неотрицательные
+    числа. При check_plausibility однотарифное показание сравнивается с предыдущим (не меньше) и со
+    средним потреблением check_avg (не больше AVERAGE_LIMIT_FACTOR средних). У многотарифных
+    счётчиков на карточке одно предыдущее показание, поэтому зоны по отдельности не сравниваются.
+    """
+    if len(values) != len(counter.value_fields) or len(values) != counter.tariff_count:
+        return const.REASON_TARIFF_ZONES
+    numbers = [float(value) if isinstance(value, (int, float)) else parse_number(value) for value in values]
+    if any(number is None or not math.isfinite(number) or number < 0 for number in numbers):
+        return const.REASON_INVALID_VALUE
+    previous = counter.previous_reading
+    if not check_plausibility or len(numbers) != 1 or previous is None:
+        return None
+    consumption = numbers[0] - previous
+    if consumption < 0:
+        return const.REASON_LESS_THAN_PREVIOUS
+    average = counter.average_consumption
+    if average and consumption > average * AVERAGE_LIMIT_FACTOR:
+        return const.REASON_ABOVE_AVERAGE
+    return None
+
+
+class _TokenState:
+    """Токены сессии портала, полученные при загрузке страницы."""
+    __slots__ = ("csrf_token", "lk_token", "expires_at")
+
+    def __init__(self, csrf_token, lk_token, expires_at):
+        self.csrf_token = csrf_token
+        self.lk_token = lk_token
+        self.expires_at = expires_at
+
 
 class AtomEnergoSender:
-    def __init__(self, account_number: str):
-        self.base_url = "https://lkfl.atomsbt.ru"
-        self.session = requests.Session()
+    """Клиент сервиса передачи показаний.
+
+    Основной API асинхронный (async_get_meter_id, async_send_reading) и работает
+    поверх переданной aiohttp-сессии либо общего пула клиентов AtomClientPool (одно
+    keep-alive соединение на всех, ограничение параллельности и частоты запросов).
+    Блокирующие get_meter_id / send_reading оставлены как
+    тонкие обёртки: они поднимают собственный event loop и временную сессию, поэтому
+    их нельзя вызывать из работающего event loop.
+
+    Токены и cookies, полученные загрузкой страницы, кешируются на token_ttl секунд:
+    повторные запросы по лицевому счёту обходятся одним POST. Если портал отклоняет
+    токен, он загружается заново и запрос повторяется один раз.
+    """
+
+    def __init__(self, account_number: str, session: aiohttp.ClientSession | None = None,
+                 token_ttl: float = const.DEFAULT_TOKEN_TTL * 60, pool: "AtomClientPool | None" = None,
+                 base_url: str = BASE_URL):
+        self.base_url = base_url
+        self.counters_url = f"{base_url}{COUNTERS_PATH}"
         self.account_number = account_number
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/125.0.0.0 Safari/537.36',
-            'Accept-Language': 'ru-RU,ru;q=0.9,en-US;q=0.8,en;q=0.7',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin'
-        })
-        self.session.verify = False
+        self.session = session
+        self.pool = pool
+        self.token_ttl = token_ttl
         self.cookies = None
+        self._tokens = None
+        self._circuit_breakers = CircuitBreakers()
+        self.metrics = ClientMetrics()
+        self.capture = None     # ResponseCapture, если включён отладочный захват ответов
+        # Последний разобранный ответ checkLs и его подпись (SignedPageParser)
+        self._page = None
+        self._page_signature = None
+        self._result = None
+        self.last_page_unchanged = False
+        # Single-flight checkLs: выполняемый запрос и (время, результат) последнего успешного
+        self._inflight = None
+        self._shared = None
 
     def parse_counter_data(self, html_content):
         """Парсит все карточки счетчиков на странице, не группируя по типу ресурса."""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        counters = []
-
-        # 1. Найти все карточки счётчиков
-        card_blocks = soup.find_all("div", class_="card")
-        #for idx, card in enumerate(card_blocks):
-#            print(f"Card {idx}:", card.prettify())
-
-        #for card in card_blocks:
-        for idx, card in enumerate(card_blocks[1:]):  # Начинаем с 1-го элемента
-            counter = {
-                "name": None,  # "Холодное водоснабжение", "Электроснабжение", и т.д.
-                "zavod_nomer": None,  # № 12345678
-                "previous_value": None,  # Последнее показание
-                "fields": {}  # Все input name/value (text + hidden)
-            }
-
-            # Название счётчика (тип услуги)
-            strong_tag = card.find("strong")
-            if strong_tag:
-                counter_name = strong_tag.get_text(strip=True)
-                if counter_name.endswith("."):
-                    counter_name = counter_name[:len(counter_name) - 1]
-                counter["name"] = counter_name
-
-            # Заводской номер (из <h2> "№ ...")
-            h2_tags = card.find_all("h2")
-            for h2 in h2_tags:
-                if "№" in h2.text:
-                    counter["zavod_nomer"] = h2.get_text(strip=True).split("№")[-1].strip()
-                    break
+        return parse_page(html_content).as_dict()
 
-            # Предыдущее показание (ищем div, содержащий только цифры)
-            float_rights = card.find_all("div", class_="float-right")
-            for fr in float_rights:
-                if "Предыдущее показание" in fr.get_text(strip=True):
-                    value_div = fr.find("div")
-                    if value_div:
-                        #counter["previous_value"] = value_div.get_text(strip=True).split()[0]  # Получаем только число
-                        previous_value_text = value_div.get_text(strip=True)
-
-                        # Используем регулярное выражение для извлечения только цифр
-                        match = re.search(r'\d+', previous_value_text)
-                        if match:
-                            counter["previous_value"] = match.group(0)  # Сохраняем только найденное число
-                    break
+    async def _async_request(self, method, url, timeout, phase, **kwargs):
+        """Выполняет запрос и возвращает (status, text, cookies); время и размер ответа - в метрики этапа phase.
 
-            # Все input поля
-            for input_field in card.find_all("input"):
-                name = input_field.get("name")
-                value = input_field.get("value", "")
-                if name:
-                    counter["fields"][name] = value
-
-            counters.append(counter)
-
-        # 2. Общие токены (вне карточек)
-        service_tokens = {}
-        for token_name in ["lk_add_value_token"]:
-            token_input = soup.find("input", {"name": token_name})
-            if token_input:
-                service_tokens[token_name] = token_input.get("value")
-
-        return {
-            "counters": counters,
-            "service_tokens": service_tokens
-        }
+        Временные сбои (обрыв соединения, таймаут, HTTP 5xx/429) повторяются до RETRY_ATTEMPTS
+        раз с экспоненциальной задержкой и джиттером; передача показаний (PHASE_SEND) - только
+        при ошибке установки соединения. Пока circuit breaker хоста разомкнут, запрос сразу
+        завершается PortalUnavailableError.
+        """
+        breaker = self.circuit_breaker(url)
+        breaker.before_call()
+        for attempt in range(1, RETRY_ATTEMPTS + 1):
+            try:
+                result = await self._async_limited_send(method, url, timeout, phase, **kwargs)
+            except Exception as e:
+                if not _is_transient_error(e):
+                    breaker.record_success()  # Портал ответил, сбой не связан с его доступностью
+                    raise
+                if attempt == RETRY_ATTEMPTS or not _can_retry(e, phase):
+                    breaker.record_failure()
+                    raise
+                _LOGGER.debug("[AtomEnergoSender::request] Попытка %s/%s: %s", attempt, RETRY_ATTEMPTS, e)
+            else:
+                if result[0] not in TRANSIENT_STATUSES:
+                    breaker.record_success()
+                    return result
+                if attempt == RETRY_ATTEMPTS or phase == PHASE_SEND:
+                    breaker.record_failure()
+                    return result
+                _LOGGER.debug("[AtomEnergoSender::request] Попытка %s/%s: HTTP %s", attempt, RETRY_ATTEMPTS, result[0])
+            await asyncio.sleep(retry_delay(attempt))
 
-    def get_meter_id(self):
-        """Получаем номер счетчика с правильными параметрами запроса"""
-        # Сначала загружаем страницу для получения токенов
-        custom_log("[AtomEnergoSender::get_meter_id] [start]")
-        init_url = f"{self.base_url}/lk_auth/counters.php?source=ABINTERNETBR"
+    async def _async_limited_send(self, method, url, timeout, phase, **kwargs):
+        if self.pool is not None:
+            # Общий пул: ограничение параллельных запросов и частоты обращений к хосту
+            async with self.pool.limit(url):
+                return await self._async_send(method, url, timeout, phase, **kwargs)
+        return await self._async_send(method, url, timeout, phase, **kwargs)
+
+    async def _async_send(self, method, url, timeout, phase, headers=None, parser=None, **kwargs):
+        """parser - фабрика PageParser: тело ответа разбирается по мере чтения, вместо текста
+        возвращается сам парсер (его close() отдаёт ParsedPage)."""
+        session = self.session if self.pool is None else self.pool.session
+        if session is None:
+            raise RuntimeError("aiohttp-сессия не задана: используйте блокирующие обёртки или передайте session")
+        with self.metrics.measure(phase) as measurement:
+            async with session.request(
+                method,
+                url,
+                headers={**DEFAULT_HEADERS, **(headers or {})},
+                timeout=aiohttp.ClientTimeout(total=timeout),
+                ssl=False,
+                **kwargs
+            ) as response:
+                recording = self.capture.start(phase, response.status) if self.capture is not None else None
+                if parser is None:
+                    body = await response.read()
+                    measurement.size = len(body)
+                    if recording is not None:
+                        recording.feed(body)
+                        recording.finish()
+                    text = body.decode(response.get_encoding())
+                else:
+                    text = parser()
+                    measurement.size = await self._async_feed_parser(response, text, recording)
+                cookies = {name: morsel.value for name, morsel in response.cookies.items()}
+                return response.status, text, cookies
+
+    async def _async_feed_parser(self, response, page_parser, recording=None):
+        """Читает тело ответа частями в page_parser, пока разбор не завершён; возвращает число прочитанных байт."""
+        decoder = codecs.getincrementaldecoder(response.charset or "utf-8")()
+        size = 0
+        parse_time = 0.0
+        truncated = True
         try:
-            response = self.session.get(init_url, timeout=10)
-            response.raise_for_status()
-            self.cookies = response.cookies.get_dict() # Сохраняем cookies для последующих запросов
-            custom_log(f"[AtomEnergoSender::get_meter_id] [Запрос к сайту kolatom.ru по ЛС {self.account_number}. Статус {response.status_code}]") 
-            custom_log(f"[AtomEnergoSender::get_meter_id] [First (empty) Query. response.status_code [{response.status_code}]")
-            #custom_log(f"[AtomEnergoSender::get_meter_id] [First (empty) Query. response.text [ {response.text}]")
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            # Парсим токены из HTML
-            custom_log(f"[AtomEnergoSender::get_meter_id] [parsing Tokens]")
-            csrf_token = soup.find('meta', {'name': 'csrf-token-value'}).get('content')
-            lk_token = soup.find('input', {'name': 'lk_add_value_token'}).get('value')
-            custom_log(f"[AtomEnergoSender::get_meter_id] [csrf_token] = [{csrf_token}]")
-            custom_log(f"[AtomEnergoSender::get_meter_id] [lk_token] = [{lk_token}]")
-            if not all([csrf_token, lk_token]):
-                raise ValueError("Не удалось извлечь токены из страницы")
-
-        except Exception as e:
-            custom_log(f"Ошибка при получении токенов: {str(e)}")
-            return {"meter_id": const.ERR_TOKEN_EXTRACT}
-
-        # Формируем правильный запрос
-        url = f"{self.base_url}/lk_auth/counters.php?source=ABINTERNETBR"
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MAX_RESPONSE_BYTES:
+                    raise ValueError(f"Ответ портала больше {MAX_RESPONSE_BYTES} байт")
+                if recording is not None:
+                    recording.feed(chunk)
+                start = time.perf_counter()
+                page_parser.feed(decoder.decode(chunk))
+                parse_time += time.perf_counter() - start
+                if page_parser.complete:
+                    break
+            else:
+                page_parser.feed(decoder.decode(b"", final=True))
+                truncated = False
+                return size
+        finally:
+            self.metrics.phases[PHASE_PARSE].add(parse_time)
+            if recording is not None:
+                recording.finish(truncated)
+
+        # Разбор завершён досрочно (сообщение портала или все карточки и токен уже получены)
+        _LOGGER.debug("[AtomEnergoSender::stream] Разбор завершён после %s байт", size)
+        drained = 0
+        while drained <= DRAIN_LIMIT:
+            chunk = await response.content.readany()
+            if not chunk:
+                return size
+            drained += len(chunk)
+        response.close()
+        return size
+
+    def circuit_breaker(self, url=None):
+        """Circuit breaker хоста портала (общий для пула, иначе - свой у клиента)."""
+        breakers = self.pool.circuit_breakers if self.pool is not None else self._circuit_breakers
+        return breakers.get(URL(url or self.base_url).host)
+
+    def set_capture_size(self, size):
+        """Отладочный захват: последние size ответов портала в памяти (0 - выключен)."""
+        if not size:
+            self.capture = None
+        elif self.capture is None or self.capture.size != size:
+            self.capture = ResponseCapture(size)
+
+    @property
+    def tokens_cached(self):
+        """True, если токены сессии портала есть в кеше и не истекли."""
+        return self._tokens is not None and self._tokens.expires_at > time.monotonic()
+
+    @property
+    def portal_available(self):
+        """False, пока circuit breaker хоста портала разомкнут."""
+        return self.circuit_breaker().state != CircuitBreaker.OPEN
+
+    def _run_blocking(self, method, *args):
+        """Выполняет async-метод клиента в собственном event loop с временной сессией."""
+        async def runner():
+            previous_session, previous_pool = self.session, self.pool
+            async with aiohttp.ClientSession() as session:
+                self.session, self.pool = session, None
+                try:
+                    return await method(*args)
+                finally:
+                    self.session, self.pool = previous_session, previous_pool
+
+        return asyncio.run(runner())
+
+    def invalidate_tokens(self):
+        """Сбрасывает закешированные токены и cookies - следующий запрос начнётся с загрузки страницы."""
+        self._tokens = None
+        self.cookies = None
+
+    async def _async_bootstrap(self):
+        """Первый запрос: получаем csrf-токен, lk_add_value_token и cookies сессии портала."""
+        _LOGGER.debug("[AtomEnergoSender::bootstrap] [start] ЛС [%s]", self.account_number)
+        status, page_parser, cookies = await self._async_request(
+            "GET", self.counters_url, GET_TIMEOUT, PHASE_BOOTSTRAP, raise_for_status=True,
+            parser=functools.partial(PageParser, stop=STOP_AFTER_TOKENS),
+        )
+        _LOGGER.debug("[AtomEnergoSender::bootstrap] [First (empty) Query. response.status_code [%s]", status)
+
+        # Токены из HTML (страница дочитывается только до них)
+        page = page_parser.close()
+        csrf_token = page.csrf_token
+        lk_token = page.service_tokens.get('lk_add_value_token')
+        _LOGGER.debug("[AtomEnergoSender::bootstrap] [csrf_token] = [%s], [lk_token] = [%s]", csrf_token, lk_token)
+        if not all([csrf_token, lk_token]):
+            raise ValueError("Не удалось извлечь токены из страницы")
+
+        self.cookies = cookies # Сохраняем cookies для последующих запросов
+        self._tokens = _TokenState(csrf_token, lk_token, time.monotonic() + self.token_ttl)
+        return self._tokens
+
+    async def _async_get_tokens(self):
+        """Возвращает (tokens, from_cache): токены из кеша, пока не истёк TTL, иначе загружает заново."""
+        tokens = self._tokens
+        from_cache = tokens is not None and tokens.expires_at > time.monotonic()
+        self.metrics.cache_result(CACHE_TOKENS, from_cache)
+        if from_cache:
+            return tokens, True
+        return await self._async_bootstrap(), False
+
+    def _update_tokens(self, lk_token, cookies):
+        """Портал выдаёт новый lk_add_value_token в ответах - запоминаем его для следующего запроса."""
+        if self._tokens is None:
+            return
+        if lk_token:
+            self._tokens.lk_token = lk_token
+        if cookies:
+            self.cookies = {**(self.cookies or {}), **cookies}
+
+    async def _async_post(self, form_data, tokens, phase, extra_headers=None, parser=None):
+        """POST на counters.php с текущими токенами; возвращает (status, text или парсер, cookies)."""
         headers = {
             'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
             'X-Requested-With': 'XMLHttpRequest',
             'Origin': self.base_url,
-            'Referer': f"{self.base_url}/lk_auth/counters.php?source=ABINTERNETBR",
+            'Referer': self.counters_url,
+            **(extra_headers or {}),
         }
+        return await self._async_request(
+            "POST",
+            self.counters_url,
+            POST_TIMEOUT,
+            phase,
+            headers=headers,
+            data={**form_data, 'lk_add_value_token': tokens.lk_token, 'csrftoken': tokens.csrf_token},
+            cookies=self.cookies,  # Используем сохраненные cookies
+            parser=parser,
+        )
 
+    def _check_page_result(self, page_parser):
+        """Результат потокового разбора checkLs; возвращает (ParsedPage, lk_add_value_token).
+
+        Если карточки не изменились с прошлого ответа, возвращается прежний результат (тот же
+        объект, координатор не обновляет сенсоры); из нового ответа берётся только токен.
+        Совпадение подписи ответа обнаруживается до разбора; если подпись не сравнить
+        (прошлый ответ дочитан до конца), сравниваются разобранные карточки.
+        """
+        page = page_parser.close()
+        if page_parser.unchanged:
+            self.metrics.cache_result(CACHE_PAGE, True)
+            self.last_page_unchanged = True
+            return self._page, page_parser.service_token
+        lk_token = page.service_tokens.get('lk_add_value_token')
+        self._page_signature = page_parser.signature
+        unchanged = self._page is not None and page.alert == self._page.alert and page.counters == self._page.counters
+        self.metrics.cache_result(CACHE_PAGE, unchanged)
+        self.last_page_unchanged = unchanged
+        if unchanged:
+            return self._page, lk_token
+        self._page, self._result = page, page.as_dict()
+        return page, lk_token
+
+    async def async_get_meter_id(self):
+        """Получаем номер счетчика с правильными параметрами запроса.
+
+        Вызовы по лицевому счёту во время выполняемого запроса (форма добавления, опрос
+        координатора, сервис) ждут его и получают тот же результат; успешный результат
+        переиспользуется ещё SHARED_RESULT_TTL секунд. Результат общий - его не изменяют.
+        """
+        if self._shared is not None and time.monotonic() - self._shared[0] < SHARED_RESULT_TTL:
+            self.metrics.cache_result(CACHE_SHARED, True)
+            return self._shared[1]
+        inflight = self._inflight
+        if inflight is not None and inflight.get_loop() is asyncio.get_running_loop():
+            self.metrics.cache_result(CACHE_SHARED, True)
+        else:
+            self.metrics.cache_result(CACHE_SHARED, False)
+            inflight = self._inflight = asyncio.ensure_future(self._async_fetch_meter_id())
+        # Отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(inflight)
+
+    async def _async_fetch_meter_id(self):
+        try:
+            result = await self._async_get_meter_id()
+        finally:
+            if self._inflight is asyncio.current_task():
+                self._inflight = None
+        if "meter_id" in result:
+            self.metrics.error(result["meter_id"])
+        else:
+            self._shared = (time.monotonic(), result)
+        return result
+
+    def invalidate_result(self):
+        """Следующий checkLs - новым запросом (после передачи показаний карточки меняются)."""
+        self._shared = None
+
+    async def _async_get_meter_id(self):
+        _LOGGER.debug("[AtomEnergoSender::get_meter_id] [start] ЛС [%s]", self.account_number)
         form_data = {
             'ls': self.account_number,
-            'lk_add_value_token': lk_token,
             'action': 'checkLs',
-            'csrftoken': csrf_token
         }
 
-        try:
-            response = self.session.post(
-                url,
-                headers=headers,
-                data=form_data,
-                cookies=self.cookies,  # Используем сохраненные cookies
-                timeout=15
-            )
+        for attempt in range(2):
+            # Токены берём из кеша; загрузка страницы - только при первом запросе или по истечении TTL
+            try:
+                tokens, from_cache = await self._async_get_tokens()
+            except PortalUnavailableError as e:
+                _LOGGER.debug("[AtomEnergoSender::get_meter_id] %s", e)
+                return {"meter_id": const.ERR_PORTAL_UNAVAILABLE}
+            except Exception as e:
+                _LOGGER.warning("Ошибка при получении токенов по ЛС %s: %s", self.account_number, e)
+                return {"meter_id": const.ERR_TOKEN_EXTRACT}
 
-            #custom_log(f"[AtomEnergoSender::get_meter_id] При загрузке - lk_add_value_token [ {lk_token} ]\ncsrftoken [ {csrf_token} ]")
-            custom_log(f"[AtomEnergoSender::get_meter_id] [Second (needed) Query. response.status_code [{response.status_code}]")
-            #custom_log(f"[AtomEnergoSender::get_meter_id] [Second (needed) Query. response.text [ {response.text}]")
-            if response.status_code == 200:
-                data = self.parse_counter_data(response.text)
-
-                # Сохраняем HTML для отладки
-                with open('counter_page.html', 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-                    
-                soup = BeautifulSoup(response.text, 'html.parser')
-                matching_divs = [] # Найдём все div'ы, а потом фильтруем по тексту
-                cntr = 0
-                err = 0
-                for div in soup.find_all('div'):
-                    cntr += 1
-                    clean_text = ' '.join(div.get_text().split())
-                    custom_log(f"[AtomEnergoSender::get_meter_id] [FindAlert] [cntr = {cntr}], [div] = [{clean_text}]")
-                    if div and div.get_text(strip=True).startswith("Занесение показаний возможно с 5 по 25"):
-                        matching_divs.append(div)
-                        err = const.ERR_NO_DATA_PERIOD
-                        break
-                    if div and div.get_text(strip=True).startswith("Лицевой счет не найден"):
-                        matching_divs.append(div)
-                        err = const.ERR_LS_NOT_FOUND
-                        break
-                    if div and div.get_text(strip=True).startswith("Ошибка проверки лицевого счета"):
-                        matching_divs.append(div)
-                        err = const.ERR_LS_CHECK
-                        break
-                    if div and div.get_text(strip=True).startswith("Отсутствуют счётчики для занесения показаний"):
-                        matching_divs.append(div)
-                        err = const.ERR_NO_COUNTERS
-                        break
-                # Проверка
-                if matching_divs:
-                    if err == -1:
-                        custom_log("[AtomEnergoSender::get_meter_id] [Ошибка] Получено сообщение о невозможности занесения показаний вне периода с 5 по 25 число!")
-                    if err == -2:
-                        custom_log("[AtomEnergoSender::get_meter_id] [Ошибка] Получено сообщение об отсутствии лицевого счета")
-                    if err == -3:
-                        custom_log("[AtomEnergoSender::get_meter_id] [Ошибка] Получено сообщение об отсутствии электросчетчиков")
-                    return {"meter_id": str(err)}
-                else:
-                    custom_log("[AtomEnergoSender::get_meter_id] Сообщений с 5 по 25 число НЕТ]")
-                    # Анализируем результаты
-                    if len(data["counters"]) == 0:
-                        custom_log("[AtomEnergoSender::get_meter_id] [Ошибка] Не удалось определить номер счетчика")
-                        return {"meter_id": "None"}
-                    return data
-            else:
-                custom_log(f"[AtomEnergoSender::get_meter_id] [Ошибка] HTTP: {response.status_code}")
-                return {"meter_id": const.ERR_RESPONSE_CODE}
-        except Exception as e:
-            custom_log(f"[AtomEnergoSender::get_meter_id] [Ошибка] при получении токенов: {str(e)}")
-            return {"meter_id": const.ERR_TOKEN_EXTRACT}
-
-    def prepare_submission(self, counter_data, meter_value):
-        """Подготавливаем данные для отправки"""
+            try:
+                status, page_parser, cookies = await self._async_post(
+                    form_data, tokens, PHASE_CHECK_LS,
+                    parser=functools.partial(SignedPageParser, self._page_signature, stop=STOP_AFTER_CARDS),
+                )
+                _LOGGER.debug("[AtomEnergoSender::get_meter_id] [checkLs Query. response.status_code [%s], tokens from cache [%s]", status, from_cache)
+                page, lk_token = self._check_page_result(page_parser) if status == 200 else (None, None)
+            except PortalUnavailableError as e:
+                _LOGGER.debug("[AtomEnergoSender::get_meter_id] %s", e)
+                return {"meter_id": const.ERR_PORTAL_UNAVAILABLE}
+            except Exception as e:
+                _LOGGER.warning("[AtomEnergoSender::get_meter_id] [Ошибка] запроса по ЛС %s: %s", self.account_number, e)
+                return {"meter_id": const.ERR_TOKEN_EXTRACT}
+
+            if from_cache and _is_token_rejected(status, page):
+                # Устаревший токен: один повтор после свежей загрузки страницы
+                _LOGGER.debug("[AtomEnergoSender::get_meter_id] Токен отклонён порталом (HTTP %s), повтор с новым токеном", status)
+                self.invalidate_tokens()
+                continue
+            break
+
+        if page is None:
+            _LOGGER.warning("[AtomEnergoSender::get_meter_id] [Ошибка] HTTP: %s", status)
+            self.invalidate_tokens()
+            return {"meter_id": const.ERR_RESPONSE_CODE}
+        self._update_tokens(lk_token, cookies)
+
+        if page.alert:
+            _LOGGER.info("[AtomEnergoSender::get_meter_id] Получено сообщение портала по ЛС %s [%s]", self.account_number, page.alert_text)
+            return {"meter_id": page.alert}
+        _LOGGER.debug("[AtomEnergoSender::get_meter_id] Сообщений портала нет, карточек [%s]", len(page.counters))
+        # Анализируем результаты
+        if len(page.counters) == 0:
+            _LOGGER.warning("[AtomEnergoSender::get_meter_id] [Ошибка] Не удалось определить номер счетчика по ЛС %s", self.account_number)
+            return {"meter_id": "None"}
+        return self._result
+
+    def get_meter_id(self):
+        """Блокирующая обёртка над async_get_meter_id"""
+        return self._run_blocking(self.async_get_meter_id)
+
+    def prepare_submission(self, readings):
+        """Подготавливаем одну форму для всех переданных счетчиков (токены подставляются при отправке).
+
+        readings - список пар (Counter из разбора страницы, показания по тарифным зонам).
+        Поля карточек имеют вид counters[<id>][...], поэтому портал принимает их в одном запросе.
+        """
         form_data = {
-            # Основное поле с показаниями
-            counter_data['value_field']['name']: meter_value,
-            # Все поля счетчика
-            **counter_data['counter_fields'],
-            # Сервисные токены
-            **counter_data['service_tokens'],
             'action': 'add',
             'ls': self.account_number #'ls': nomer_ls
         }
+        for counter, values in readings:
+            # Все поля счетчика
+            form_data.update(counter.fields)
+            # Поля с показаниями - по порядку тарифных зон
+            for field_name, value in zip(counter.value_fields, values):
+                form_data[field_name] = _format_value(value)
         return form_data
 
+    async def async_send_readings(self, readings, check_plausibility=True):
+        """Отправка показаний по нескольким счетчикам/тарифам лицевого счета одним запросом.
+
+        Показания сначала проверяются локально (validate_reading): не прошедшие проверку
+        не отправляются, и если не прошли все - запроса нет. Ответ портала относится ко всей
+        форме, поэтому отказ портала получают все отправленные счётчики.
+        Возвращает {counter_id: SubmissionResult} для каждого переданного счетчика.
+        """
+        results = {}
+        batch = []
+        for counter, values in readings:
+            values = _as_list(values)
+            reason = validate_reading(counter, values, check_plausibility)
+            if reason is None:
+                batch.append((counter, values))
+            else:
+                _LOGGER.info("Показания счётчика %s по ЛС %s не переданы: %s %s", counter.id, self.account_number, reason, values)
+                results[counter.id] = SubmissionResult(counter.id, False, reason)
+        if not batch:
+            return results
+        payload = self.prepare_submission(batch)
+
+        status = None
+        error_code = const.ERR_RESPONSE_CODE
+        for attempt in range(2):
+            try:
+                tokens, from_cache = await self._async_get_tokens()
+                _LOGGER.debug("[AtomEnergoSender::send_readings] [lk_add_value_token] = [%s], [csrftoken] = [%s]", tokens.lk_token, tokens.csrf_token)
+                status, text, cookies = await self._async_post(payload, tokens, PHASE_SEND, {'X-CSRFToken': tokens.csrf_token})
+                _LOGGER.debug("[AtomEnergoSender::send_readings] Статус код: %s, ответ сервера (%s байт): %.500s", status, len(text), text)
+            except Exception as e:
+                _LOGGER.warning("Ошибка отправки показаний по ЛС %s: %s", self.account_number, e)
+                if isinstance(e, PortalUnavailableError):
+                    error_code = const.ERR_PORTAL_UNAVAILABLE
+                status = None
+                break
+
+            if from_cache and status in TOKEN_REJECTED_STATUSES:
+                _LOGGER.debug("[AtomEnergoSender::send_readings] Токен отклонён порталом (HTTP %s), повтор с новым токеном", status)
+                self.invalidate_tokens()
+                continue
+            break
+
+        self.invalidate_result()
+        if status != 200:
+            self.metrics.error(error_code)
+            self.invalidate_tokens()
+            results.update((counter.id, SubmissionResult(counter.id, False, const.REASON_PORTAL_ERROR)) for counter, _ in batch)
+            return results
+
+        self._update_tokens(find_service_token(text), cookies)
+        reply = parse_submission_reply(text)
+        if reply.accepted is False:
+            _LOGGER.warning("Портал не принял показания по ЛС %s: %s", self.account_number, reply.message)
+            self.metrics.error(const.ERR_READING_REJECTED)
+            results.update(
+                (counter.id, SubmissionResult(counter.id, False, const.REASON_PORTAL_REJECTED, reply.message))
+                for counter, _ in batch
+            )
+            return results
+        if reply.accepted is None:
+            # HTTP 200 без сообщения портала: показания могли быть и приняты, и нет
+            _LOGGER.warning("Ответ портала на передачу показаний по ЛС %s не распознан: %.200s", self.account_number, text)
+            results.update(
+                (counter.id, SubmissionResult(counter.id, None, const.REASON_UNCONFIRMED)) for counter, _ in batch
+            )
+            return results
+        results.update((counter.id, SubmissionResult(counter.id, True, None, reply.message)) for counter, _ in batch)
+        return results
+
+    async def async_send_reading(self, meter_id, value):
+        """Отправка показаний одного счетчика (value - число или список по тарифным зонам); True, если приняты."""
+        results = await self.async_send_readings([(meter_id, value)])
+        return all(result.accepted is True for result in results.values())
+
     def send_reading(self, meter_id, value):
-        """Отправка показаний с полной эмуляцией браузера"""
-        url = f"{self.base_url}/lk_auth/counters.php?source=ABINTERNETBR"
-        payload = self.prepare_submission(meter_id, value)
-        custom_log(f"[AtomEnergoSender::send_reading] [lk_add_value_token] = [ {payload['lk_add_value_token']} ]\ncsrftoken [ {payload['csrftoken']} ]")
-        headers = {
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'X-Requested-With': 'XMLHttpRequest',
-            'X-CSRFToken': payload['csrftoken'],
-            'Origin': self.base_url,
-            'Referer': f"{self.base_url}/lk_auth/counters.php?source=ABINTERNETBR",
-        }
-#        custom_log(payload)
+        """Блокирующая обёртка над async_send_reading"""
+        return self._run_blocking(self.async_send_reading, meter_id, value)
 
-        try:
-            response = self.session.post(
-                url,
-                headers=headers,
-                data=payload,
-                cookies=self.cookies,  # Используем сохраненные cookies
-                timeout=15
+    def send_readings(self, readings):
+        """Блокирующая обёртка над async_send_readings"""
+        return self._run_blocking(self.async_send_readings, readings)
+
+
+class HostRateLimiter:
+    """Не чаще requests_per_second запусков запросов к одному хосту."""
+
+    def __init__(self, requests_per_second: float):
+        self._interval = 1 / requests_per_second if requests_per_second > 0 else 0
+        self._next_start = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, host):
+        if not self._interval:
+            return
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            start = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start + self._interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+class AtomClientPool:
+    """Общие для всех лицевых счетов соединение, лимиты и клиенты.
+
+    Один TCPConnector на все записи, не более max_concurrency одновременных запросов
+    к порталу и не более requests_per_second запусков запросов к хосту. Клиенты
+    (AtomEnergoSender) создаются один раз на лицевой счёт и переиспользуются вместе с
+    кешем токенов.
+    """
+
+    def __init__(self, max_concurrency: int = const.DEFAULT_MAX_CONCURRENCY,
+                 requests_per_second: float = const.DEFAULT_REQUESTS_PER_SECOND,
+                 base_url: str = BASE_URL):
+        self.base_url = base_url
+        self.configure(max_concurrency, requests_per_second)
+        self.circuit_breakers = CircuitBreakers()
+        self._session = None
+        self._senders = {}
+
+    def configure(self, max_concurrency: int, requests_per_second: float):
+        """Лимиты пула; можно менять и у пула, который уже выполнял запросы (новые запросы - по новым лимитам)."""
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._rate_limiter = HostRateLimiter(requests_per_second)
+
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                # Число одновременных запросов ограничивает семафор (его меняет configure), не соединитель
+                connector=aiohttp.TCPConnector(limit=0, ssl=False),
+                # Cookies каждого лицевого счёта хранит его клиент, общий cookie jar не нужен
+                cookie_jar=aiohttp.DummyCookieJar(),
             )
-            custom_log(f"[AtomEnergoSender::send_reading] Статус код: {response.status_code}")
-            custom_log(f"[AtomEnergoSender::send_reading] Ответ сервера: {response.text}")
+        return self._session
+
+    @contextlib.asynccontextmanager
+    async def limit(self, url):
+        async with self._semaphore:
+            await self._rate_limiter.acquire(URL(url).host)
+            yield
+
+    def get_sender(self, account_number: str, token_ttl: float | None = None,
+                   capture_size: int | None = None) -> AtomEnergoSender:
+        """Клиент лицевого счёта (один на счёт)."""
+        sender = self._senders.get(account_number)
+        if sender is None:
+            sender = self._senders[account_number] = AtomEnergoSender(account_number, pool=self, base_url=self.base_url)
+        if token_ttl is not None:
+            sender.token_ttl = token_ttl
+        if capture_size is not None:
+            sender.set_capture_size(capture_size)
+        return sender
+
+    def release_sender(self, account_number: str):
+        self._senders.pop(account_number, None)
+
+    async def async_close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+def _as_list(values):
+    """Показания одной тарифной зоны допускается передавать без списка."""
+    if isinstance(values, (list, tuple)):
+        return list(values)
+    return [values]
+
+
+def _format_value(value):
+    """Показание в виде, в котором его вводят в форму: без экспоненты и хвостовых нулей."""
+    if isinstance(value, float):
+        return f"{value:f}".rstrip("0").rstrip(".")
+    return str(value)
 
-            return response.status_code == 200
 
-        except Exception as e:
-            custom_log(f"Ошибка отправки: {str(e)}")
-            return False
\ No newline at end of file
+def _is_token_rejected(status, page):
+    """Признаки отклонённого (устаревшего) токена в ответе на checkLs."""
+    if status in TOKEN_REJECTED_STATUSES:
+        return True
+    # Портал отвечает пустой страницей без карточек и без сообщения, если сессия/токен не приняты
+    return page is not None and not page.counters and page.alert is None
@@ -0,0 +1,54 @@
+## Отладочный захват ответов портала: последние N ответов по лицевому счёту в памяти
+
+import collections
+import time
+import zlib
+
+
+class _Recording:
+    """Ответ, который сейчас читается: тело сжимается по мере поступления частей."""
+    __slots__ = ("_capture", "_compressor", "_chunks", "entry")
+
+    def __init__(self, capture, phase, status):
+        self._capture = capture
+        self._compressor = zlib.compressobj()
+        self._chunks = []
+        self.entry = {"time": time.time(), "phase": phase, "status": status, "bytes": 0, "truncated": False}
+
+    def feed(self, chunk):
+        self.entry["bytes"] += len(chunk)
+        compressed = self._compressor.compress(chunk)
+        if compressed:
+            self._chunks.append(compressed)
+
+    def finish(self, truncated=False):
+        self._chunks.append(self._compressor.flush())
+        self.entry["truncated"] = truncated
+        self.entry["data"] = b"".join(self._chunks)
+        self._capture.entries.append(self.entry)
+
+
+class ResponseCapture:
+    """Кольцевой буфер последних size ответов (zlib), без записи на диск."""
+
+    def __init__(self, size):
+        self.entries = collections.deque(maxlen=size)
+
+    @property
+    def size(self):
+        return self.entries.maxlen
+
+    def start(self, phase, status):
+        return _Recording(self, phase, status)
+
+    def as_list(self, redact=None):
+        """Ответы от старых к новым с распакованным телом (redact - функция обработки текста)."""
+        result = []
+        for entry in self.entries:
+            text = zlib.decompress(entry["data"]).decode("utf-8", errors="replace")
+            result.append({
+                **{key: value for key, value in entry.items() if key != "data"},
+                "compressed_bytes": len(entry["data"]),
+                "body": redact(text) if redact else text,
+            })
+        return result
@@ -0,0 +1,211 @@
+## Массовая проверка лицевых счетов без Home Assistant (тот же запрос checkLs, что в форме добавления)
+#
+#     python custom_components/atomenergosbyt/cli.py accounts.txt [--workers 8] [--rps 4] [--format csv]
+#     cat accounts.txt | python custom_components/atomenergosbyt/cli.py -
+#
+# Результат по каждому счёту выводится сразу после проверки (JSON lines или CSV),
+# итог (число счетов, ошибки по кодам, скорость, перцентили задержки) - в stderr.
+
+import argparse
+import asyncio
+import collections
+import csv
+import json
+import logging
+import math
+import sys
+import time
+
+if not __package__:
+    # Запуск файлом: пакет интеграции при импорте тянет homeassistant, поэтому
+    # регистрируем пустой пакет с тем же путём (как benchmarks/_pkg.py)
+    import os
+    import types
+    _package = types.ModuleType("atomenergosbyt")
+    _package.__path__ = [os.path.dirname(os.path.abspath(__file__))]
+    sys.modules.setdefault("atomenergosbyt", _package)
+    __package__ = "atomenergosbyt"
+
+from . import const
+from .atomsbt_lib import BASE_URL, AtomClientPool
+
+_LOGGER = logging.getLogger(__name__)
+
+# Название кода ошибки по значению: "-1002" -> "ERR_LS_NOT_FOUND"
+ERROR_NAMES = {value: name for name, value in vars(const).items() if name.startswith("ERR_")}
+ERR_INVALID_LS = "invalid_ls"           # Не цифры - на портал не отправляется (как в форме добавления)
+
+CSV_FIELDS = ("ls", "status", "error", "error_name", "latency_ms", "counter_id", "name", "zavod_nomer", "previous_value")
+PERCENTILES = (0.5, 0.95, 0.99)
+
+
+def read_accounts(sources):
+    """Номера счетов из файлов (или stdin - "-"): по одному в строке, # - комментарий, повторы убираются.
+
+    Читается до запуска цикла событий; закрываются только открытые здесь файлы, stdin - нет.
+    """
+    accounts = {}
+    for source in sources:
+        if source == "-":
+            _add_accounts(accounts, sys.stdin)
+        else:
+            with open(source, encoding="utf-8") as stream:
+                _add_accounts(accounts, stream)
+    return list(accounts)
+
+
+def _add_accounts(accounts, lines):
+    for line in lines:
+        ls_number = line.split("#", 1)[0].strip()
+        if ls_number:
+            accounts.setdefault(ls_number, None)
+
+
+async def check_account(pool, ls_number):
+    """Результат checkLs по счёту: счётчики или код ошибки const.ERR_*."""
+    if not ls_number.isdigit():
+        return {"ls": ls_number, "status": "error", "error": ERR_INVALID_LS, "error_name": None, "latency_ms": None}
+    sender = pool.get_sender(ls_number)
+    start = time.perf_counter()
+    try:
+        data = await sender.async_get_meter_id()
+    finally:
+        # Клиенты не переиспользуются: сотни счетов не держат токены и cookies в памяти
+        pool.release_sender(ls_number)
+    result = {"ls": ls_number, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+    error = data.get("meter_id")
+    if error is None and not data["counters"]:
+        error = const.ERR_NO_COUNTERS
+    if error is not None:
+        return {**result, "status": "error", "error": error, "error_name": ERROR_NAMES.get(error)}
+    return {
+        **result,
+        "status": "ok",
+        "counters": [
+            {"id": counter.id, "name": counter.name, "zavod_nomer": counter.zavod_nomer, "previous_value": counter.previous_value}
+            for counter in data["counters"]
+        ],
+    }
+
+
+class JsonLinesWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, result):
+        self.stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+class CsvWriter:
+    """Строка на счётчик; счёт без счётчиков (ошибка) - одна строка с пустыми полями счётчика."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, CSV_FIELDS, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, result):
+        counters = result.get("counters") or [{}]
+        for counter in counters:
+            self.writer.writerow({
+                **result,
+                "counter_id": counter.get("id"),
+                "name": counter.get("name"),
+                "zavod_nomer": counter.get("zavod_nomer"),
+                "previous_value": counter.get("previous_value"),
+            })
+        self.stream.flush()
+
+
+class Summary:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = 0
+        self.errors = collections.Counter()
+        self.latencies = []
+
+    def add(self, result):
+        self.total += 1
+        if result["status"] != "ok":
+            self.errors[result["error_name"] or result["error"]] += 1
+        if result["latency_ms"] is not None:
+            self.latencies.append(result["latency_ms"])
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self.start
+        latencies = sorted(self.latencies)
+        return {
+            "accounts": self.total,
+            "ok": self.total - sum(self.errors.values()),
+            "errors": dict(self.errors),
+            "elapsed_s": round(elapsed, 2),
+            "accounts_per_s": round(self.total / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                **{f"p{round(fraction * 100)}": _percentile(latencies, fraction) for fraction in PERCENTILES},
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+
+def _percentile(values, fraction):
+    """Перцентиль по отсортированному списку (ближайший ранг)."""
+    if not values:
+        return None
+    return values[max(math.ceil(fraction * len(values)) - 1, 0)]
+
+
+async def run(accounts, writer, workers, requests_per_second, base_url=BASE_URL):
+    """Проверка счетов workers задачами; результаты пишутся по мере готовности. Возвращает Summary."""
+    pool = AtomClientPool(max_concurrency=workers, requests_per_second=requests_per_second, base_url=base_url)
+    queue = asyncio.Queue(maxsize=workers * 2)
+    summary = Summary()
+
+    async def _worker():
+        while (ls_number := await queue.get()) is not None:
+            result = await check_account(pool, ls_number)
+            summary.add(result)
+            writer.write(result)
+
+    tasks = [asyncio.create_task(_worker()) for _ in range(workers)]
+    try:
+        for ls_number in accounts:
+            await queue.put(ls_number)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await pool.async_close()
+    return summary
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Массовая проверка лицевых счетов АтомЭнергоСбыт (checkLs)")
+    arg_parser.add_argument("files", nargs="*", default=["-"], help="файлы с номерами ЛС (по умолчанию stdin)")
+    arg_parser.add_argument("-w", "--workers", type=int, default=const.DEFAULT_MAX_CONCURRENCY, help="одновременных проверок")
+    arg_parser.add_argument("--rps", type=float, default=const.DEFAULT_REQUESTS_PER_SECOND,
+                            help="запусков запросов к порталу в секунду (0 - без ограничения)")
+    arg_parser.add_argument("-f", "--format", choices=("jsonl", "csv"), default="jsonl")
+    arg_parser.add_argument("-o", "--output", help="файл результатов (по умолчанию stdout)")
+    arg_parser.add_argument("--base-url", default=BASE_URL, help=argparse.SUPPRESS)
+    arg_parser.add_argument("-v", "--verbose", action="store_true", help="журнал запросов в stderr")
+    args = arg_parser.parse_args(argv)
+    if args.workers < 1:
+        arg_parser.error("--workers должно быть не меньше 1")
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING, stream=sys.stderr)
+    output = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        writer = (CsvWriter if args.format == "csv" else JsonLinesWriter)(output)
+        accounts = read_accounts(args.files)
+        summary = asyncio.run(run(accounts, writer, args.workers, args.rps, args.base_url))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(summary.as_dict(), ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,36 @@
 ## Форма взаимодействия с пользователем - при добавлении интеграции
 
+import logging
 import voluptuous as vol
 import homeassistant.helpers.config_validation as cv
 from homeassistant import config_entries
+from homeassistant.core import callback
 from homeassistant.helpers import selector
 from typing import Any
 from . import const
-from .atomsbt_lib import AtomEnergoSender, custom_log
+from .coordinator import get_client_pool
+
+_LOGGER = logging.getLogger(__name__)
 
 class atomenergosbytConfigFlow(config_entries.ConfigFlow, domain=const.DOMAIN):
-    VERSION = 1
+    VERSION = 2
+
+    def __init__(self):
+        self._checked = set()   # Счета, проверенные запросом к порталу (клиент создан в общем пуле)
+
+    @callback
+    def _async_release_senders(self):
+        """Клиенты проверенных, но не добавленных счетов (с токенами и cookies) - из общего пула."""
+        registered = {entry.data.get(const.CONF_LS_NUMBER) for entry in self._async_current_entries()}
+        pool = get_client_pool(self.hass)
+        for ls_number in self._checked - registered:
+            pool.release_sender(ls_number)
+        self._checked.clear()
+
+    @callback
+    def async_remove(self):
+        """Мастер закрыт (в том числе без добавления счёта)."""
+        self._async_release_senders()
     
     # Добавление интеграции (регистрация лицевого счета)
     async def async_step_user(self, user_input=None):
@@ -25,31 +46,32 @@ class atomenergosbytConfigFlow(config_entries.ConfigFlow, domain=const.DOMAIN):
             )
     
         ls_number = user_input.get(const.CONF_LS_NUMBER, "").strip()
-        custom_log(f"async_step_user:ls_number [{ls_number}]")
+        _LOGGER.debug("async_step_user:ls_number [%s]", ls_number)
     
         # Проверка: только цифры
         if not ls_number.isdigit():
             errors["base"] = "invalid_ls"
-            custom_log(f"async_step_user:ls_number NOT isdigit()")
+            _LOGGER.debug("async_step_user:ls_number NOT isdigit()")
         else:
             # Проверка на дублирование
             for entry in self._async_current_entries():
                 if entry.data.get(const.CONF_LS_NUMBER) == ls_number:
                     errors["base"] = "exist_ls"
-                    custom_log(f"async_step_user:ls_number уже существует")
+                    _LOGGER.debug("async_step_user:ls_number уже существует")
                     break
     
         if not errors:
             # Проверяем данные с сервера
-            sender = AtomEnergoSender(ls_number)
-            parseData = await self.hass.async_add_executor_job(sender.get_meter_id)
+            sender = get_client_pool(self.hass).get_sender(ls_number)
+            self._checked.add(ls_number)
+            parseData = await sender.async_get_meter_id()
             if "meter_id" in parseData:
                 meter_id = parseData["meter_id"]
             elif len(parseData["counters"]) == 0:
                 meter_id = const.ERR_NO_COUNTERS
             else:
                 meter_id = 0
-            custom_log(f"async_step_user:parseData[meter_id] = {meter_id}")
+            _LOGGER.debug("async_step_user:parseData[meter_id] = %s", meter_id)
     
             if meter_id == "None":
                 errors["base"] = "invalid_ls"
@@ -74,13 +96,21 @@ class atomenergosbytConfigFlow(config_entries.ConfigFlow, domain=const.DOMAIN):
                 errors["base"] = "http_response_error"
             elif meter_id == const.ERR_TOKEN_EXTRACT:
                 errors["base"] = "http_token_error"
+            elif meter_id == const.ERR_PORTAL_UNAVAILABLE:
+                errors["base"] = "portal_unavailable"
             elif meter_id == const.ERR_UNKNOWN_ERROR:
                 errors["base"] = "unknown_error"
             else:
                 return self.async_create_entry(
                     title=f"Лицевой счет № {ls_number}",
-                    data={const.CONF_LS_NUMBER: ls_number, const.CONF_COUNTERS_DATA: parseData}
+                    # В записи только идентификаторы счётчиков: показания и токены устаревают сразу
+                    data={
+                        const.CONF_LS_NUMBER: ls_number,
+                        const.CONF_COUNTERS: [counter.as_entry_data() for counter in parseData["counters"]],
+                    }
                 )
+            # Счёт не прошёл проверку - его клиент в пуле не нужен
+            self._async_release_senders()
     
         # Показываем форму заново с ошибками
         return self.async_show_form(
@@ -98,8 +128,8 @@ class atomenergosbytConfigFlow(config_entries.ConfigFlow, domain=const.DOMAIN):
             if user_input.get("confirm"):
                 # Пользователь согласился продолжить регистрацию
                 return self.async_create_entry(
-                    title=f"Лицевой счет № {ls_number}",
-                    data={const.CONF_LS_NUMBER: self.ls_number}
+                    title=f"Лицевой счет № {self.ls_number}",
+                    data={const.CONF_LS_NUMBER: self.ls_number, const.CONF_COUNTERS: []}
                 )
             else:
                 # Пользователь отказался
@@ -116,3 +146,58 @@ class atomenergosbytConfigFlow(config_entries.ConfigFlow, domain=const.DOMAIN):
             },
             errors=errors
         )
+
+    @staticmethod
+    @callback
+    def async_get_options_flow(config_entry):
+        return AtomEnergoOptionsFlow()
+
+
+class AtomEnergoOptionsFlow(config_entries.OptionsFlow):
+    """Настройки лицевого счета."""
+
+    async def async_step_init(self, user_input=None):
+        counters = self.config_entry.data.get(const.CONF_COUNTERS, [])
+        if user_input is not None:
+            # Поля source_<counter_id> собираются в {counter_id: [entity_id, ...]}
+            sources = {}
+            for counter in counters:
+                entity_ids = user_input.pop(f"{const.CONF_SOURCE_PREFIX}{counter['id']}", None)
+                if entity_ids:
+                    sources[counter["id"]] = entity_ids
+            return self.async_create_entry(title="", data={**user_input, const.CONF_SOURCES: sources})
+
+        options = self.config_entry.options
+        sources = options.get(const.CONF_SOURCES, {})
+        # Сенсоры-источники для автопередачи: по одному на тарифную зону, по порядку зон
+        source_fields = {
+            vol.Optional(
+                f"{const.CONF_SOURCE_PREFIX}{counter['id']}",
+                description={"suggested_value": sources.get(counter["id"], [])},
+            ): selector.EntitySelector(selector.EntitySelectorConfig(domain="sensor", multiple=True))
+            for counter in counters
+        }
+        return self.async_show_form(
+            step_id="init",
+            description_placeholders={
+                "counters": "\n".join(
+                    f"{const.CONF_SOURCE_PREFIX}{counter['id']}: {counter['name']} № {counter['zavod_nomer']}"
+                    for counter in counters
+                ) or "-",
+            },
+            data_schema=vol.Schema({
+                vol.Required(
+                    const.CONF_TOKEN_TTL,
+                    default=options.get(const.CONF_TOKEN_TTL, const.DEFAULT_TOKEN_TTL)
+                ): vol.All(vol.Coerce(int), vol.Range(min=1, max=24 * 60)),
+                vol.Required(
+                    const.CONF_LOG_LEVEL,
+                    default=options.get(const.CONF_LOG_LEVEL, const.DEFAULT_LOG_LEVEL)
+                ): vol.In(const.LOG_LEVEL_OPTIONS),
+                vol.Required(
+                    const.CONF_CAPTURE_RESPONSES,
+                    default=options.get(const.CONF_CAPTURE_RESPONSES, const.DEFAULT_CAPTURE_RESPONSES)
+                ): vol.All(vol.Coerce(int), vol.Range(min=0, max=const.MAX_CAPTURE_RESPONSES)),
+                **source_fields,
+            })
+        )
@@ -1,6 +1,9 @@
+from datetime import timedelta
+
 DOMAIN = "atomenergosbyt"
 CONF_LS_NUMBER = "ls_number"
-CONF_COUNTERS_DATA = "counters_data"
+CONF_COUNTERS = "counters"              # Идентификаторы счётчиков: [{"id", "zavod_nomer", "name"}]
+CONF_COUNTERS_DATA = "counters_data"    # Снимок разбора страницы в записях версии 1 (только для миграции)
 
 # Константы ошибок
 ERR_NO_DATA_PERIOD = "-1001"           # Период закрыт (5–25 число)
@@ -9,4 +12,51 @@ ERR_LS_CHECK       = "-1003"           # Ошибка проверки лице
 ERR_NO_COUNTERS    = "-1004"           # Счётчики отсутствуют
 ERR_UNKNOWN_ERROR  = "-1009"           # Неизвестно когда такая ошибка может выпасть
 ERR_RESPONSE_CODE  = "-1011"           # Ошибка HTTP-ответа
-ERR_TOKEN_EXTRACT  = "-1012"           # Не удалось извлечь токен
\ No newline at end of file
+ERR_TOKEN_EXTRACT  = "-1012"           # Не удалось извлечь токен
+ERR_PORTAL_UNAVAILABLE = "-1013"       # Портал недоступен (серия сбоев, запросы временно не выполняются)
+ERR_READING_REJECTED = "-1014"         # Портал не принял показания (сообщение об ошибке в ответе)
+
+# Причины отказа в передаче показаний счётчика (SubmissionResult.reason)
+REASON_UNKNOWN_COUNTER = "unknown_counter"          # Счётчика нет на странице лицевого счёта
+REASON_TARIFF_ZONES = "tariff_zones_mismatch"       # Число показаний не совпадает с числом тарифных зон
+REASON_INVALID_VALUE = "invalid_value"              # Не число или отрицательное значение
+REASON_LESS_THAN_PREVIOUS = "less_than_previous"    # Меньше последнего показания
+REASON_ABOVE_AVERAGE = "above_average"              # Потребление во много раз больше среднего (check_avg)
+REASON_PORTAL_REJECTED = "portal_rejected"          # Портал ответил сообщением об ошибке
+REASON_PORTAL_ERROR = "portal_error"                # Ошибка запроса (HTTP, сеть, портал недоступен)
+REASON_UNCONFIRMED = "unconfirmed"                  # Ответ портала не распознан: приняты ли показания, неизвестно
+# Проверки значения (не формы) можно пропустить: например, после замены счётчика
+PLAUSIBILITY_REASONS = (REASON_LESS_THAN_PREVIOUS, REASON_ABOVE_AVERAGE)
+
+# Периодичность опроса личного кабинета (один запрос на лицевой счёт)
+DEFAULT_SCAN_INTERVAL = timedelta(hours=1)
+
+# Ключи в hass.data[DOMAIN][entry_id]
+DATA_COORDINATOR = "coordinator"
+DATA_OPTIONS = "options"
+
+# Настройки (options) записи
+CONF_TOKEN_TTL = "token_ttl"
+DEFAULT_TOKEN_TTL = 30                 # Минут: время жизни токенов сессии портала
+CONF_CAPTURE_RESPONSES = "capture_responses"
+DEFAULT_CAPTURE_RESPONSES = 0          # Отладочный захват ответов портала в память (0 - выключен)
+MAX_CAPTURE_RESPONSES = 20
+CONF_SOURCES = "sources"               # Автопередача: {counter_id: [entity_id локальных сенсоров по тарифным зонам]}
+CONF_SOURCE_PREFIX = "source_"         # Поле формы настроек для счётчика: source_<counter_id>
+CONF_LOG_LEVEL = "log_level"
+DEFAULT_LOG_LEVEL = "info"
+LOG_LEVEL_OPTIONS = ["debug", "info", "warning", "error"]
+
+# Сервисы
+SERVICE_SEND_READINGS = "send_readings"
+ATTR_READINGS = "readings"
+ATTR_COUNTER_ID = "counter_id"
+ATTR_VALUES = "values"
+ATTR_SKIP_VALIDATION = "skip_validation"
+
+# Общий пул запросов к порталу (configuration.yaml: atomenergosbyt:)
+CONF_MAX_CONCURRENCY = "max_concurrent_requests"
+CONF_REQUESTS_PER_SECOND = "requests_per_second"
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_REQUESTS_PER_SECOND = 2.0
+DATA_CLIENT_POOL = "client_pool"
@@ -0,0 +1,135 @@
+## Потребление по ряду показаний: за сутки, месяц, расчётный период и скользящее среднее
+
+from array import array
+from datetime import datetime, timedelta
+
+BILLING_LAST_DAY = 25       # Показания за расчётный период принимаются до 25 числа
+ROLLING_PERIODS = 3         # Скользящее среднее - по последним завершённым расчётным периодам
+SECONDS_PER_DAY = 86400
+
+
+def month_key(date: datetime) -> int:
+    return date.year * 12 + date.month - 1
+
+
+def billing_period_key(date: datetime) -> int:
+    """Расчётный период: с 26 числа предыдущего месяца по 25 число текущего."""
+    key = month_key(date)
+    return key + 1 if date.day > BILLING_LAST_DAY else key
+
+
+def month_start(date: datetime) -> datetime:
+    """Начало месяца (полночь 1 числа) - last_reset сенсора потребления за месяц."""
+    return date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def billing_period_start(date: datetime) -> datetime:
+    """Начало расчётного периода (полночь 26 числа) - last_reset сенсора потребления за период."""
+    start = month_start(date)
+    if date.day <= BILLING_LAST_DAY:
+        start = month_start(start - timedelta(days=1))
+    return start.replace(day=BILLING_LAST_DAY + 1)
+
+
+class CounterSeries:
+    """Ряд показаний одного счётчика и суммы потребления по месяцам и расчётным периодам.
+
+    Потребление между соседними точками относится к месяцу и периоду более поздней точки.
+    Новая точка обновляет только свои суммы; исправление за ту же дату заменяет последнюю.
+    """
+    __slots__ = ("timestamps", "values", "by_month", "by_period", "_last_keys")
+
+    def __init__(self):
+        self.timestamps = array("d")
+        self.values = array("d")
+        self.by_month = {}
+        self.by_period = {}
+        self._last_keys = None  # (месяц, период) последней точки - для отката исправления
+
+    def extend(self, points):
+        """Добавляет точки [(datetime, показание), ...] по возрастанию даты пачкой (загрузка истории)."""
+        points = [(date, value) for date, value in points if not self.timestamps or date.timestamp() > self.timestamps[-1]]
+        if not points:
+            return
+        values = array("d", (value for _, value in points))
+        # Предыдущее показание для каждой новой точки (для первой точки ряда - она сама)
+        previous = (self.values[-1:] or values[:1]) + values[:-1]
+        deltas = [max(value - before, 0.0) for before, value in zip(previous, values)]
+        for (date, _), delta in zip(points, deltas):
+            self._apply(date, delta)
+        self.timestamps.extend(date.timestamp() for date, _ in points)
+        self.values.extend(values)
+
+    def add(self, date: datetime, value: float):
+        """Новая точка; точка за ту же дату заменяет последнюю (исправление показаний)."""
+        timestamp = date.timestamp()
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            return
+        if self.timestamps and timestamp == self.timestamps[-1]:
+            self._undo_last()
+            self.timestamps.pop()
+            self.values.pop()
+        delta = max(value - self.values[-1], 0.0) if self.values else 0.0
+        self._apply(date, delta)
+        self.timestamps.append(timestamp)
+        self.values.append(value)
+
+    def _apply(self, date, delta):
+        keys = (month_key(date), billing_period_key(date))
+        self.by_month[keys[0]] = self.by_month.get(keys[0], 0.0) + delta
+        self.by_period[keys[1]] = self.by_period.get(keys[1], 0.0) + delta
+        self._last_keys = keys
+
+    def _undo_last(self):
+        if len(self.values) < 2 or self._last_keys is None:
+            return
+        delta = max(self.values[-1] - self.values[-2], 0.0)
+        self.by_month[self._last_keys[0]] -= delta
+        self.by_period[self._last_keys[1]] -= delta
+
+    @property
+    def last_value(self):
+        return self.values[-1] if self.values else None
+
+    @property
+    def last_delta(self):
+        """Потребление между двумя последними показаниями."""
+        if len(self.values) < 2:
+            return None
+        return max(self.values[-1] - self.values[-2], 0.0)
+
+    @property
+    def daily(self):
+        """Среднее суточное потребление за последний интервал между показаниями."""
+        if len(self.values) < 2:
+            return None
+        days = (self.timestamps[-1] - self.timestamps[-2]) / SECONDS_PER_DAY
+        return self.last_delta / days if days > 0 else None
+
+    def month_total(self, now: datetime):
+        return self.by_month.get(month_key(now), 0.0) if self.values else None
+
+    def period_total(self, now: datetime):
+        return self.by_period.get(billing_period_key(now), 0.0) if self.values else None
+
+    def rolling_average(self, now: datetime, periods: int = ROLLING_PERIODS):
+        """Среднее потребление за последние завершённые расчётные периоды (периоды без данных не учитываются)."""
+        current = billing_period_key(now)
+        totals = [self.by_period[key] for key in range(current - periods, current) if key in self.by_period]
+        return sum(totals) / len(totals) if totals else None
+
+
+class ConsumptionEngine:
+    """Ряды показаний всех счётчиков лицевого счёта (ключ - ReadingHistory.key)."""
+
+    def __init__(self):
+        self._series = {}
+
+    def load(self, key, points):
+        self._series.setdefault(key, CounterSeries()).extend(points)
+
+    def add(self, key, date, value):
+        self._series.setdefault(key, CounterSeries()).add(date, value)
+
+    def get(self, key) -> CounterSeries | None:
+        return self._series.get(key)
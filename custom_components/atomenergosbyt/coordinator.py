@@ -0,0 +1,188 @@
+## Координатор обновления данных по лицевому счёту
+
+import logging
+from datetime import timedelta
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE
+from homeassistant.core import CALLBACK_TYPE, HomeAssistant, callback
+from homeassistant.helpers.event import async_track_time_change
+from homeassistant.util import dt as dt_util
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+from . import const
+from .atomsbt_lib import AtomClientPool
+from .consumption import ConsumptionEngine
+from .history import ReadingHistory, counter_date_pok
+from .outbox import ReadingOutbox
+from .scheduler import MIN_INTERVAL, next_update_interval
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def get_client_pool(hass: HomeAssistant, config: dict | None = None) -> AtomClientPool:
+    """Общий для всех записей пул клиентов портала (создаётся при первом обращении).
+
+    config - настройки из configuration.yaml: применяются и к пулу, который уже создан с
+    настройками по умолчанию (например, мастером добавления до async_setup).
+    """
+    domain_data = hass.data.setdefault(const.DOMAIN, {})
+    pool = domain_data.get(const.DATA_CLIENT_POOL)
+    limits = (
+        (config or {}).get(const.CONF_MAX_CONCURRENCY, const.DEFAULT_MAX_CONCURRENCY),
+        (config or {}).get(const.CONF_REQUESTS_PER_SECOND, const.DEFAULT_REQUESTS_PER_SECOND),
+    )
+    if pool is not None:
+        if config is not None:
+            pool.configure(*limits)
+    else:
+        pool = domain_data[const.DATA_CLIENT_POOL] = AtomClientPool(*limits)
+
+        async def _async_close_pool(event):
+            await pool.async_close()
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, _async_close_pool)
+    return pool
+
+
+class AtomEnergoCoordinator(DataUpdateCoordinator):
+    """Один запрос к личному кабинету на лицевой счёт за интервал.
+
+    Результат разбора страницы раздаётся всем сенсорам счётчиков этого лицевого счёта,
+    сами сенсоры ничего не опрашивают.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
+        ls_number = entry.data.get(const.CONF_LS_NUMBER)
+        super().__init__(
+            hass,
+            _LOGGER,
+            config_entry=entry,
+            name=f"{const.DOMAIN}_{ls_number}",
+            update_interval=const.DEFAULT_SCAN_INTERVAL,
+            # Слушатели вызываются после каждого опроса (метрики меняются и при тех же карточках);
+            # сенсоры счётчиков и потребления не пишут состояние, если их значения не изменились
+            always_update=True,
+        )
+        self.entry = entry
+        self.ls_number = ls_number
+        self.history = ReadingHistory(hass, entry)
+        self.consumption = ConsumptionEngine()
+        self.outbox = ReadingOutbox(hass, entry)
+        self._counters_by_id = (None, {})   # (data, {counter_id: Counter}) - индекс для сенсоров
+        self.sender = get_client_pool(hass).get_sender(
+            ls_number,
+            token_ttl=entry.options.get(const.CONF_TOKEN_TTL, const.DEFAULT_TOKEN_TTL) * 60,
+            capture_size=entry.options.get(const.CONF_CAPTURE_RESPONSES, const.DEFAULT_CAPTURE_RESPONSES),
+        )
+        self.diagnostics = self._collect_diagnostics()
+
+    async def _async_update_data(self):
+        """Опрос портала; метрики клиента для диагностических сенсоров - после каждого опроса, и неудачного."""
+        failed = not self.last_update_success
+        try:
+            data = await self._async_fetch_data()
+            failed = False
+            return data
+        finally:
+            self.diagnostics = self._collect_diagnostics()
+            if failed:
+                # Повторную ошибку DataUpdateCoordinator слушателям не передаёт, а метрики изменились
+                self.async_update_listeners()
+
+    def _collect_diagnostics(self):
+        """Снимок метрик клиента и состояния circuit breaker портала."""
+        breaker = self.sender.circuit_breaker()
+        return {
+            **self.sender.metrics.as_dict(),
+            "portal_state": breaker.state,
+            "retry_after": round(breaker.retry_after),
+        }
+
+    async def _async_fetch_data(self):
+        """Получаем и разбираем страницу счётчиков."""
+        data = await self.sender.async_get_meter_id()
+        if "meter_id" not in data:
+            if data is not self.data:
+                # В историю и статистику попадают только новые точки (DatePok, показание)
+                added = self.history.async_add_counters(data["counters"])
+                for key, points in added.items():
+                    for point in points:
+                        self.consumption.add(key, point["start"], point["state"])
+                self._update_entry_counters(data["counters"])
+            self._schedule_next(data["counters"])
+            self._flush_outbox(data["counters"])
+            return data
+
+        meter_id = data["meter_id"]
+        _LOGGER.debug("[AtomEnergoCoordinator::_async_update_data] ls_number [%s], meter_id [%s]", self.ls_number, meter_id)
+        if meter_id == const.ERR_NO_DATA_PERIOD:
+            # Вне периода 5–25 портал не отдаёт счётчики - оставляем последние известные данные
+            self._schedule_next((self.data or {}).get("counters", []), period_closed=True)
+            return self.data or {"counters": [], "service_tokens": {}}
+        # Сенсоры станут недоступны
+        if meter_id == const.ERR_PORTAL_UNAVAILABLE:
+            # Следующий опрос - не раньше пробы circuit breaker
+            self.update_interval = max(timedelta(seconds=self.sender.circuit_breaker().retry_after), MIN_INTERVAL)
+            raise UpdateFailed(f"Портал недоступен, ЛС {self.ls_number}: следующая попытка через {self.update_interval}")
+        # Ответ портала с ошибкой (ЛС не найден, нет счётчиков, ...) чаще опросов по расписанию не повторяем
+        self._schedule_next((self.data or {}).get("counters", []))
+        raise UpdateFailed(f"Ошибка получения данных по ЛС {self.ls_number}: {meter_id}")
+
+    @callback
+    def async_track_midnight(self) -> CALLBACK_TYPE:
+        """Один таймер на лицевой счёт: в полночь сенсоры пересчитывают значения за месяц и расчётный период.
+
+        Период сменяется и без нового ответа портала. Возвращает функцию отписки.
+        """
+        return async_track_time_change(self.hass, self._async_midnight, hour=0, minute=0, second=0)
+
+    @callback
+    def _async_midnight(self, _now):
+        # Сенсоры, у которых ничего не изменилось, состояние не пишут
+        self.async_update_listeners()
+
+    def counter(self, counter_id):
+        """Карточка счётчика из последнего результата (индекс по id строится один раз на результат)."""
+        data, index = self._counters_by_id
+        if data is not self.data:
+            index = {counter.id: counter for counter in (self.data or {}).get("counters", [])}
+            self._counters_by_id = (self.data, index)
+        return index.get(counter_id)
+
+    async def async_load_history(self):
+        """История показаний и ряды потребления по ней (одним проходом на счётчик), очередь передачи."""
+        await self.history.async_load()
+        await self.outbox.async_load()
+        for key in self.history.keys():
+            self.consumption.load(key, self.history.points(key))
+
+    async def async_save_history(self):
+        """История показаний и очередь передачи - на диск сейчас (при выгрузке записи)."""
+        await self.history.async_save()
+        await self.outbox.async_save()
+
+    def _flush_outbox(self, counters):
+        """Автопередача показаний из локальных сенсоров - в фоне, по свежим карточкам счётчиков."""
+        self.outbox.reconcile(counters)
+        due = self.outbox.due(dt_util.now())
+        if due:
+            self.entry.async_create_background_task(
+                self.hass, self.outbox.async_flush(self.sender, counters, due), f"{const.DOMAIN}_outbox_{self.ls_number}"
+            )
+
+    def _update_entry_counters(self, counters):
+        """Новые счётчики (и сменившиеся номер/название) - в запись конфигурации."""
+        known = {counter["id"]: counter for counter in self.entry.data.get(const.CONF_COUNTERS, [])}
+        updated = dict(known)
+        for counter in counters:
+            if counter.id is not None:
+                updated[counter.id] = counter.as_entry_data()
+        if updated != known:
+            self.hass.config_entries.async_update_entry(
+                self.entry, data={**self.entry.data, const.CONF_COUNTERS: list(updated.values())}
+            )
+
+    def _schedule_next(self, counters, period_closed=False):
+        """Следующий опрос: чаще в период 5–25 и после смены DatePok, редко вне периода."""
+        dates = [date for date in map(counter_date_pok, counters) if date is not None]
+        self.update_interval = next_update_interval(dt_util.now(), self.ls_number, max(dates, default=None), period_closed)
+        _LOGGER.debug("[AtomEnergoCoordinator] ls_number [%s], следующий опрос через %s", self.ls_number, self.update_interval)
@@ -0,0 +1,47 @@
+## Диагностика записи: состояние опроса, портала и метрики запросов
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant
+from . import const
+from .page_parser import redact_tokens
+
+# Номер лицевого счёта (и заголовок записи с ним), токены и cookies сессии портала
+TO_REDACT = {
+    const.CONF_LS_NUMBER,
+    "title",
+    "unique_id",
+    "lk_add_value_token",
+    "csrftoken",
+    "csrf_token",
+    "lk_token",
+    "cookies",
+}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict:
+    coordinator = hass.data[const.DOMAIN][entry.entry_id][const.DATA_COORDINATOR]
+    sender = coordinator.sender
+    breaker = sender.circuit_breaker()
+    data = coordinator.data or {}
+    return async_redact_data({
+        "entry": entry.as_dict(),
+        "coordinator": {
+            "last_update_success": coordinator.last_update_success,
+            "last_exception": repr(coordinator.last_exception) if coordinator.last_exception else None,
+            "update_interval": str(coordinator.update_interval),
+            "counters": len(data.get("counters", [])),
+            "service_tokens": data.get("service_tokens"),
+        },
+        "portal": {
+            "circuit_state": breaker.state,
+            "consecutive_failures": breaker.failures,
+            "retry_after": round(breaker.retry_after),
+            "tokens_cached": sender.tokens_cached,
+            "last_page_unchanged": sender.last_page_unchanged,
+        },
+        "metrics": sender.metrics.as_dict(),
+        "outbox": coordinator.outbox.as_dict(),
+        # Отладочный захват (если включён в настройках): тела ответов без токенов
+        "captured_responses": sender.capture.as_list(redact_tokens) if sender.capture is not None else None,
+    }, TO_REDACT)
@@ -0,0 +1,141 @@
+## История показаний счётчиков и импорт во внешнюю статистику recorder
+
+import logging
+from datetime import datetime
+from homeassistant.components.recorder.models import StatisticData, StatisticMetaData
+from homeassistant.components.recorder.statistics import async_add_external_statistics
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from . import const
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 30  # секунд: несколько счётчиков одного обновления сохраняются одной записью
+
+DATE_POK_FORMATS = ("%d.%m.%Y", "%Y-%m-%d", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S")
+
+
+def parse_date_pok(value):
+    """Дата последней передачи показаний (DatePok) в начало суток по местному времени."""
+    if not value:
+        return None
+    for date_format in DATE_POK_FORMATS:
+        try:
+            parsed = datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            continue
+        return dt_util.start_of_local_day(parsed.date())
+    return None
+
+
+def counter_date_pok(counter):
+    """DatePok карточки счётчика (Counter) как datetime (или None)."""
+    return parse_date_pok(counter.date_pok)
+
+
+def _unit_of_measurement(name):
+    if "Электроснабжение" in (name or ""):
+        return "kWh"
+    if "водоснабжение" in (name or ""):
+        return "m³"
+    return None
+
+
+def statistic_id(ls_number, counter_id):
+    return f"{const.DOMAIN}:counter_{ls_number}_{counter_id}".lower()
+
+
+class ReadingHistory:
+    """Компактная история показаний по счётчикам одного лицевого счёта.
+
+    Ключ - "<zavod_nomer>_<counter_id>", значение - точки [DatePok (ISO), показание] и
+    накопленная сумма потребления. Каждое обновление дописывает только новые точки и
+    передаёт в recorder только их (external statistics), ряд целиком не перезаписывается.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
+        self.hass = hass
+        self.ls_number = entry.data.get(const.CONF_LS_NUMBER)
+        self._store = Store(hass, STORAGE_VERSION, f"{const.DOMAIN}.history.{entry.entry_id}")
+        self._counters = {}
+
+    async def async_load(self):
+        self._counters = (await self._store.async_load() or {}).get("counters", {})
+
+    async def async_save(self):
+        """Запись без задержки: отложенная не должна выполниться после выгрузки (и удаления) записи."""
+        await self._store.async_save(self._data_to_save())
+
+    async def async_remove(self):
+        await self._store.async_remove()
+
+    def keys(self):
+        return list(self._counters)
+
+    def points(self, key):
+        """Точки истории счётчика [(datetime, показание), ...] по возрастанию даты."""
+        return [
+            (dt_util.parse_datetime(date), value)
+            for date, value in self._counters.get(key, {}).get("points", [])
+        ]
+
+    @staticmethod
+    def key(zavod_nomer, counter_id):
+        return f"{zavod_nomer}_{counter_id}"
+
+    @callback
+    def async_add_counters(self, counters):
+        """Дописывает новые точки из результата разбора страницы; возвращает {key: [новые точки]}."""
+        added = {}
+        for counter in counters:
+            date = counter_date_pok(counter)
+            value = counter.previous_reading
+            if date is None or value is None:
+                continue
+            key = self.key(counter.zavod_nomer, counter.id)
+            point = self._add_point(key, date, value)
+            if point is None:
+                continue
+            added[key] = [point]
+            self._import_statistics(counter.id, counter.name, [point])
+
+        if added:
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+        return added
+
+    def _add_point(self, key, date, value):
+        """Добавляет точку, если она новее последней; исправление за ту же дату заменяет точку."""
+        history = self._counters.setdefault(key, {"points": [], "sum": 0.0})
+        points = history["points"]
+        date_iso = date.isoformat()
+        if points:
+            last_date, last_value = points[-1]
+            if date_iso < last_date or (date_iso == last_date and value == last_value):
+                return None
+            if date_iso == last_date:
+                points.pop()
+                history["sum"] -= history.get("last_delta", 0.0)
+        delta = max(value - points[-1][1], 0.0) if points else 0.0
+        points.append([date_iso, value])
+        history["sum"] += delta
+        history["last_delta"] = delta
+        return {"start": date, "state": value, "sum": history["sum"]}
+
+    def _import_statistics(self, current_counter_id, name, points):
+        metadata = StatisticMetaData(
+            has_mean=False,
+            has_sum=True,
+            name=f"АтомЭнергоСбыт {self.ls_number} {name or current_counter_id}",
+            source=const.DOMAIN,
+            statistic_id=statistic_id(self.ls_number, current_counter_id),
+            unit_of_measurement=_unit_of_measurement(name),
+        )
+        statistics = [StatisticData(start=point["start"], state=point["state"], sum=point["sum"]) for point in points]
+        _LOGGER.debug("Импорт статистики %s: %s", metadata["statistic_id"], statistics)
+        async_add_external_statistics(self.hass, metadata, statistics)
+
+    def _data_to_save(self):
+        return {"counters": self._counters}
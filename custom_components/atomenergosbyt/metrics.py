@@ -0,0 +1,119 @@
+## Метрики клиента портала: время этапов, размер ответов, попадания в кеш, ошибки
+
+import collections
+import contextlib
+import time
+
+# Этапы запроса по лицевому счёту
+PHASE_BOOTSTRAP = "bootstrap"   # GET counters.php (токены и cookies)
+PHASE_CHECK_LS = "check_ls"     # POST action=checkLs
+PHASE_PARSE = "parse"           # Разбор страницы (суммарно по частям ответа)
+PHASE_SEND = "send"             # POST action=add
+PHASES = (PHASE_BOOTSTRAP, PHASE_CHECK_LS, PHASE_PARSE, PHASE_SEND)
+
+CACHE_TOKENS = "tokens"         # Токены из кеша вместо загрузки страницы
+CACHE_PAGE = "page"             # Карточки не изменились, сенсоры не обновляются
+CACHE_SHARED = "shared"         # checkLs: результат запроса, уже выполняемого (или только что выполненного) другим вызовом
+
+# Верхние границы корзин гистограммы, мс (последняя корзина - всё, что дольше)
+LATENCY_BUCKETS_MS = (10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 15000)
+
+
+class PhaseStats:
+    """Гистограмма длительности и объём ответов одного этапа."""
+    __slots__ = ("count", "total", "max", "last", "buckets", "bytes", "last_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = None
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.bytes = 0
+        self.last_bytes = None
+
+    def add(self, seconds, size=None):
+        milliseconds = seconds * 1000
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+        self.last = milliseconds
+        self.buckets[self._bucket(milliseconds)] += 1
+        if size is not None:
+            self.bytes += size
+            self.last_bytes = size
+
+    @staticmethod
+    def _bucket(milliseconds):
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if milliseconds <= bound:
+                return index
+        return len(LATENCY_BUCKETS_MS)
+
+    def percentile(self, fraction):
+        """Оценка перцентиля по гистограмме: верхняя граница корзины (мс)."""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(LATENCY_BUCKETS_MS[index], round(self.max, 1)) if index < len(LATENCY_BUCKETS_MS) else round(self.max, 1)
+        return self.max
+
+    def as_dict(self):
+        labels = [f"<={bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count, 1) if self.count else None,
+            "p95_ms": self.percentile(0.95),
+            "max_ms": round(self.max, 1),
+            "last_ms": round(self.last, 1) if self.last is not None else None,
+            "histogram_ms": dict(zip(labels, self.buckets)),
+            "bytes_total": self.bytes,
+            "last_bytes": self.last_bytes,
+        }
+
+
+class _Measurement:
+    __slots__ = ("size",)
+
+    def __init__(self):
+        self.size = None
+
+
+class ClientMetrics:
+    """Метрики одного клиента (лицевого счёта) с момента запуска."""
+
+    def __init__(self):
+        self.phases = {phase: PhaseStats() for phase in PHASES}
+        self.cache = {CACHE_TOKENS: [0, 0], CACHE_PAGE: [0, 0], CACHE_SHARED: [0, 0]}   # [попадания, промахи]
+        self.errors = collections.Counter()                     # По кодам const.ERR_*
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        """Замер этапа; размер ответа (байт) задаётся через measurement.size."""
+        measurement = _Measurement()
+        start = time.perf_counter()
+        try:
+            yield measurement
+        finally:
+            self.phases[phase].add(time.perf_counter() - start, measurement.size)
+
+    def cache_result(self, name, hit):
+        self.cache[name][0 if hit else 1] += 1
+
+    def error(self, code):
+        self.errors[code] += 1
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+    def as_dict(self):
+        return {
+            "phases": {phase: stats.as_dict() for phase, stats in self.phases.items()},
+            "cache": {name: {"hits": hits, "misses": misses} for name, (hits, misses) in self.cache.items()},
+            "errors": dict(self.errors),
+        }
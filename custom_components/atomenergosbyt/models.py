@@ -0,0 +1,115 @@
+## Модель счётчика из карточки counters.php
+
+import re
+
+# Поле формы счётчика: counters[<id>][<ключ>]
+_FIELD_RE = re.compile(r'counters\[(\d+)\]\[([^\]]+)\]$')
+
+
+def parse_number(value):
+    """Число из поля карточки ("1234", "1234,5", "1 234.5"); None, если не число."""
+    if value in (None, ""):
+        return None
+    try:
+        return float(str(value).replace(",", ".").replace(" ", ""))
+    except ValueError:
+        return None
+
+
+class Counter:
+    """Карточка счётчика.
+
+    Поля формы counters[<id>][<ключ>] индексируются по ключу при добавлении (один разбор
+    имени на поле), поэтому DatePok, Tarifnost и т.п. читаются без повторных поисков.
+    """
+    __slots__ = ("id", "name", "zavod_nomer", "previous_value", "fields", "value_fields", "params")
+
+    def __init__(self, name=None, zavod_nomer=None, previous_value=None):
+        self.id = None                          # ID счётчика из имён полей counters[<id>][...]
+        self.name = name                        # "Холодное водоснабжение", "Электроснабжение", и т.д.
+        self.zavod_nomer = zavod_nomer          # № 12345678
+        self.previous_value = previous_value    # Последнее показание как на карточке ("1234,5"); числом - previous_reading
+        self.fields = {}                        # Все input name/value (text + hidden) - для передачи показаний
+        self.value_fields = []                  # Поля ввода показаний (по одному на тарифную зону)
+        self.params = {}                        # Значения полей counters[<id>][<ключ>] по ключу
+
+    def add_field(self, field_name, value, hidden=True):
+        self.fields[field_name] = value
+        if not hidden:
+            self.value_fields.append(field_name)
+        match = _FIELD_RE.match(field_name)
+        if match:
+            if self.id is None:
+                self.id = match.group(1)
+            if match.group(1) == self.id:
+                self.params[match.group(2)] = value
+
+    @property
+    def date_pok(self):
+        """Дата последней передачи показаний (строка портала)."""
+        return self.params.get("DatePok")
+
+    @property
+    def check_avg(self):
+        return self.params.get("check_avg")
+
+    @property
+    def tarifnost(self):
+        return self.params.get("Tarifnost")
+
+    @property
+    def previous_reading(self):
+        """Последнее показание числом (None, если на карточке его нет) - для состояния сенсора и истории."""
+        return parse_number(self.previous_value)
+
+    @property
+    def average_consumption(self):
+        """Среднее потребление за период по данным портала (check_avg) числом."""
+        return parse_number(self.check_avg)
+
+    @property
+    def tariff_count(self):
+        """Число тарифных зон: Tarifnost, а без него - число полей ввода показаний."""
+        tarifnost = parse_number(self.tarifnost)
+        return int(tarifnost) if tarifnost else len(self.value_fields)
+
+    @property
+    def service_number(self):
+        return self.params.get("NomerUslugi")
+
+    @property
+    def tariff_name(self):
+        return self.params.get("NazvanieTarifa")
+
+    def as_entry_data(self):
+        """Долговременные идентификаторы счётчика для записи конфигурации."""
+        return {"id": self.id, "zavod_nomer": self.zavod_nomer, "name": self.name}
+
+    def as_dict(self):
+        """Словарь в прежнем формате parse_counter_data (для хранения и сравнения)."""
+        return {
+            "name": self.name,
+            "zavod_nomer": self.zavod_nomer,
+            "previous_value": self.previous_value,
+            "fields": self.fields,
+            "value_fields": self.value_fields,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Счётчик из as_dict() (или из снимка, сохранённого прежними версиями)."""
+        counter = cls(data.get("name"), data.get("zavod_nomer"), data.get("previous_value"))
+        for field_name, value in (data.get("fields") or {}).items():
+            counter.add_field(field_name, value)
+        counter.value_fields = list(data.get("value_fields") or [])
+        return counter
+
+    def __eq__(self, other):
+        if not isinstance(other, Counter):
+            return NotImplemented
+        return self.as_dict() == other.as_dict()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Counter(id={self.id!r}, name={self.name!r}, zavod_nomer={self.zavod_nomer!r}, previous_value={self.previous_value!r})"
@@ -0,0 +1,265 @@
+## Очередь автоматической передачи показаний из локальных сенсоров HA
+
+import logging
+from datetime import datetime, timedelta
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import STATE_UNAVAILABLE, STATE_UNKNOWN
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.event import async_call_later, async_track_state_change_event
+from homeassistant.helpers.storage import Store
+from homeassistant.util import dt as dt_util
+from . import const
+from .consumption import month_key
+from .history import counter_date_pok
+from .models import parse_number
+from .scheduler import in_submission_window
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 30                         # секунд: изменения сенсоров-источников сохраняются пачкой
+
+RETRY_BASE = timedelta(minutes=15)      # Повтор неудачной передачи: 15 мин, 30 мин, 1 ч, ... до 6 ч
+RETRY_MAX = timedelta(hours=6)
+# После ошибки запроса или неподтверждённого приёма - внеочередной опрос и, при необходимости, повтор
+RETRY_REASONS = (const.REASON_PORTAL_ERROR, const.REASON_UNCONFIRMED)
+
+
+def retry_interval(attempts: int) -> timedelta:
+    return min(RETRY_BASE * 2 ** max(attempts - 1, 0), RETRY_MAX)
+
+
+class ReadingOutbox:
+    """Показания локальных сенсоров, ожидающие передачи на портал (по одному лицевому счёту).
+
+    Сенсоры-источники задаются в настройках записи: {counter_id: [entity_id по тарифным зонам]}.
+    В очереди хранится только последнее показание счётчика; то же значение, что уже в очереди
+    или уже передано, не записывается. Очередь переживает перезапуск HA (Store).
+
+    Передача - одним запросом по всем счётчикам лицевого счёта, один раз за период приёма
+    показаний (5–25), после успешного опроса портала. Неудачная передача повторяется с
+    увеличивающимся интервалом через внеочередной опрос портала. Передача, приём которой
+    портал не подтвердил (ответ не распознан), проверяется по DatePok карточки при следующем
+    опросе и повторяется, только если портал её не отразил.
+    """
+
+    def __init__(self, hass: HomeAssistant, entry: ConfigEntry):
+        self.hass = hass
+        self.ls_number = entry.data.get(const.CONF_LS_NUMBER)
+        self.sources = {
+            counter_id: list(entity_ids)
+            for counter_id, entity_ids in entry.options.get(const.CONF_SOURCES, {}).items() if entity_ids
+        }
+        self._store = Store(hass, STORAGE_VERSION, f"{const.DOMAIN}.outbox.{entry.entry_id}")
+        self.pending = {}       # {counter_id: {"values": [...], "updated": ISO, "rejected": причина отказа}}
+        self.sent = {}          # {counter_id: {"values": [...], "period": месяц, "time": ISO}}
+        self.unconfirmed = {}   # {counter_id: {"values": [...], "time": ISO}} - ждут проверки по карточке
+        self.attempts = 0
+        self.next_attempt = None
+        self._cancel_retry = None
+        self._request_refresh = None
+        self._flushing = False
+
+    @property
+    def enabled(self):
+        return bool(self.sources)
+
+    async def async_load(self):
+        data = await self._store.async_load() or {}
+        self.pending = data.get("pending", {})
+        self.sent = data.get("sent", {})
+        self.unconfirmed = data.get("unconfirmed", {})
+        self.attempts = data.get("attempts", 0)
+        self.next_attempt = dt_util.parse_datetime(data["next_attempt"]) if data.get("next_attempt") else None
+        # Счётчики, для которых источник убран из настроек, не передаются
+        for counter_id in set(self.pending) - set(self.sources):
+            del self.pending[counter_id]
+
+    async def async_save(self):
+        """Запись без задержки: отложенная не должна выполниться после выгрузки (и удаления) записи."""
+        await self._store.async_save(self._data_to_save())
+
+    async def async_remove(self):
+        await self._store.async_remove()
+
+    @callback
+    def async_start(self, request_refresh):
+        """Подписка на сенсоры-источники; request_refresh - внеочередной опрос портала для повтора.
+
+        Возвращает функцию отписки (для entry.async_on_unload).
+        """
+        self._request_refresh = request_refresh
+        for counter_id in self.sources:
+            self._update_from_sources(counter_id)
+        entity_ids = [entity_id for entity_ids in self.sources.values() for entity_id in entity_ids]
+        unsub = async_track_state_change_event(self.hass, entity_ids, self._async_source_changed) if entity_ids else None
+
+        @callback
+        def _stop():
+            if unsub is not None:
+                unsub()
+            if self._cancel_retry is not None:
+                self._cancel_retry()
+                self._cancel_retry = None
+
+        return _stop
+
+    @callback
+    def _async_source_changed(self, event):
+        entity_id = event.data["entity_id"]
+        for counter_id, entity_ids in self.sources.items():
+            if entity_id in entity_ids:
+                self._update_from_sources(counter_id)
+
+    def _update_from_sources(self, counter_id):
+        """Текущие показания сенсоров счётчика - в очередь (если все зоны известны и значение новое)."""
+        values = []
+        for entity_id in self.sources[counter_id]:
+            state = self.hass.states.get(entity_id)
+            value = None if state is None or state.state in (STATE_UNAVAILABLE, STATE_UNKNOWN) else parse_number(state.state)
+            if value is None:
+                return
+            values.append(value)
+
+        pending = self.pending.get(counter_id)
+        if pending is not None and pending["values"] == values:
+            return
+        if pending is None and self.sent.get(counter_id, {}).get("values") == values:
+            return
+        self.pending[counter_id] = {"values": values, "updated": dt_util.utcnow().isoformat()}
+        self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    def due(self, now: datetime) -> list:
+        """Счётчики, показания которых пора передать (период открыт, в этом периоде ещё не передавались)."""
+        if self._flushing or not self.pending or not in_submission_window(now):
+            return []
+        if self.next_attempt is not None and now < self.next_attempt:
+            return []
+        period = month_key(now)
+        return [
+            counter_id for counter_id, entry in self.pending.items()
+            if not entry.get("rejected") and counter_id not in self.unconfirmed
+            and self.sent.get(counter_id, {}).get("period") != period
+        ]
+
+    def reconcile(self, counters):
+        """Проверка неподтверждённых передач по свежим карточкам счётчиков.
+
+        DatePok не раньше дня передачи - показания приняты; иначе они снова ждут передачи
+        (в срок повтора next_attempt).
+        """
+        if not self.unconfirmed:
+            return
+        cards = {counter.id: counter for counter in counters}
+        for counter_id, unconfirmed in list(self.unconfirmed.items()):
+            card = cards.get(counter_id)
+            date_pok = counter_date_pok(card) if card is not None else None
+            sent_at = dt_util.parse_datetime(unconfirmed["time"])
+            del self.unconfirmed[counter_id]
+            if date_pok is not None and date_pok >= dt_util.start_of_local_day(sent_at):
+                _LOGGER.info("Автопередача по ЛС %s: портал отразил показания счётчика %s", self.ls_number, counter_id)
+                self._mark_sent(counter_id, unconfirmed["values"], sent_at)
+            else:
+                _LOGGER.warning(
+                    "Автопередача по ЛС %s: показания счётчика %s не отражены порталом, будут переданы снова",
+                    self.ls_number, counter_id,
+                )
+        self._store.async_delay_save(self._data_to_save, 0)
+
+    def _mark_sent(self, counter_id, values, time):
+        """values переданы; из очереди убираются, только если сенсоры не прислали за это время новые."""
+        if self._is_pending(counter_id, values):
+            del self.pending[counter_id]
+        self.sent[counter_id] = {"values": values, "period": month_key(time), "time": time.isoformat()}
+
+    def _is_pending(self, counter_id, values):
+        entry = self.pending.get(counter_id)
+        return entry is not None and entry["values"] == values
+
+    async def async_flush(self, sender, counters, counter_ids):
+        """Передача показаний counter_ids одним запросом; counters - карточки последнего опроса портала."""
+        cards = {counter.id: counter for counter in counters}
+        batch = []
+        for counter_id in counter_ids:
+            counter = cards.get(counter_id)
+            if counter is None:
+                _LOGGER.warning("Автопередача по ЛС %s: счётчик %s не найден на портале", self.ls_number, counter_id)
+            else:
+                batch.append((counter, self.pending[counter_id]["values"]))
+        if not batch:
+            return {}
+
+        self._flushing = True
+        try:
+            results = await sender.async_send_readings(batch)
+        finally:
+            self._flushing = False
+        now = dt_util.now()
+        # Пока шла передача, очередь могла получить новые значения - результат относится к отправленным
+        sent_values = {counter.id: values for counter, values in batch}
+        accepted = [counter_id for counter_id, result in results.items() if result.accepted]
+        for counter_id in accepted:
+            self._mark_sent(counter_id, sent_values[counter_id], now)
+        for counter_id, result in results.items():
+            if result.reason == const.REASON_UNCONFIRMED:
+                # Не передаём повторно, пока не ясно по карточке, принял ли их портал (reconcile)
+                self.unconfirmed[counter_id] = {"values": sent_values[counter_id], "time": now.isoformat()}
+                _LOGGER.warning(
+                    "Автопередача по ЛС %s: приём показаний счётчика %s не подтверждён порталом",
+                    self.ls_number, counter_id,
+                )
+            elif not result.accepted and result.reason != const.REASON_PORTAL_ERROR:
+                # Отклонённые проверкой или порталом показания не повторяются - ждём новых значений сенсоров
+                _LOGGER.warning(
+                    "Автопередача по ЛС %s: показания счётчика %s %s не приняты (%s %s)",
+                    self.ls_number, counter_id, sent_values[counter_id], result.reason, result.message or "",
+                )
+                if self._is_pending(counter_id, sent_values[counter_id]):
+                    self.pending[counter_id]["rejected"] = result.reason
+
+        if all(result.reason not in RETRY_REASONS for result in results.values()):
+            self.attempts = 0
+            self.next_attempt = None
+            if accepted:
+                _LOGGER.info("Автопередача по ЛС %s: переданы показания счётчиков %s", self.ls_number, accepted)
+        else:
+            self.attempts += 1
+            delay = retry_interval(self.attempts)
+            self.next_attempt = now + delay
+            _LOGGER.warning(
+                "Автопередача по ЛС %s не удалась (попытка %s), повтор через %s",
+                self.ls_number, self.attempts, delay,
+            )
+            self._schedule_retry(delay)
+        self._store.async_delay_save(self._data_to_save, 0)
+        return results
+
+    def _schedule_retry(self, delay):
+        if self._cancel_retry is not None:
+            self._cancel_retry()
+
+        @callback
+        def _retry(_now):
+            self._cancel_retry = None
+            self.hass.async_create_task(self._request_refresh())
+
+        self._cancel_retry = async_call_later(self.hass, delay, _retry)
+
+    def as_dict(self):
+        return {
+            "sources": self.sources,
+            "pending": self.pending,
+            "sent": self.sent,
+            "unconfirmed": self.unconfirmed,
+            "attempts": self.attempts,
+            "next_attempt": self.next_attempt.isoformat() if self.next_attempt else None,
+        }
+
+    def _data_to_save(self):
+        return {
+            "pending": self.pending,
+            "sent": self.sent,
+            "unconfirmed": self.unconfirmed,
+            "attempts": self.attempts,
+            "next_attempt": self.next_attempt.isoformat() if self.next_attempt else None,
+        }
@@ -0,0 +1,525 @@
+## Однопроходный разбор страниц counters.php
+
+import functools
+import hashlib
+import re
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from . import const
+from .models import Counter
+
+# Сообщения портала, которые приходят вместо карточек счётчиков
+ALERT_MESSAGES = (
+    ("Занесение показаний возможно с 5 по 25", const.ERR_NO_DATA_PERIOD),
+    ("Лицевой счет не найден", const.ERR_LS_NOT_FOUND),
+    ("Ошибка проверки лицевого счета", const.ERR_LS_CHECK),
+    ("Отсутствуют счётчики для занесения показаний", const.ERR_NO_COUNTERS),
+)
+# Сколько символов текста div достаточно, чтобы решить, начинается ли он с сообщения портала
+_ALERT_PREFIX_LEN = max(len(message) for message, _ in ALERT_MESSAGES)
+
+SERVICE_TOKEN_NAMES = ("lk_add_value_token",)
+CSRF_META_NAME = "csrf-token-value"
+PREVIOUS_VALUE_LABEL = "Предыдущее показание"
+
+# Когда потоковый разбор можно остановить (PageParser.complete)
+STOP_AFTER_CARDS = "cards"      # Ответ checkLs: сообщение портала или закрытый блок карточек и lk_add_value_token
+CARDS_BLOCK_CLASS = "counters"  # div с карточками счётчиков; без него блоком считается форма с карточками
+STOP_AFTER_TOKENS = "tokens"    # Первая страница: найдены csrf-мета и lk_add_value_token
+
+_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)?')
+_TOKEN_INPUT_RE = re.compile(r'<input\b[^>]*\bname=["\']?lk_add_value_token(?=["\'\s/>])[^>]*>', re.IGNORECASE)
+_VALUE_ATTR_RE = re.compile(r'\bvalue=(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.IGNORECASE)
+_CSRF_META_RE = re.compile(r'<meta\b[^>]*\bname=["\']?csrf-token-value(?=["\'\s/>])[^>]*>', re.IGNORECASE)
+_CONTENT_ATTR_RE = re.compile(r'\bcontent=(?:"[^"]*"|\'[^\']*\'|[^\s>]+)', re.IGNORECASE)
+# Ответ на передачу показаний (action=add): сообщение портала в div.alert-success/-danger/-warning
+_REPLY_ALERT_RE = re.compile(
+    r'<div\b[^>]*\bclass=["\'][^"\']*\balert-(success|danger|warning)\b[^"\']*["\'][^>]*>(.*?)</div>',
+    re.IGNORECASE | re.DOTALL,
+)
+_TAG_RE = re.compile(r'<[^>]+>')
+# Части ответа, которые меняются в каждом ответе и не влияют на данные счётчиков (для подписи)
+_VOLATILE_RE = re.compile(f"{_TOKEN_INPUT_RE.pattern}|{_CSRF_META_RE.pattern}", re.IGNORECASE)
+_VOLATILE_PLACEHOLDER = "<token>"
+_MAX_TAG_LEN = 4096                 # Незакрытый "<" длиннее этого - не начало тега, а текст
+REDACTED = "**REDACTED**"
+_SKIP_TEXT_TAGS = ("script", "style")
+
+
+@dataclass
+class ParsedPage:
+    """Результат разбора страницы: карточки, токены и сообщение портала (если есть)."""
+    counters: list[Counter] = field(default_factory=list)
+    service_tokens: dict = field(default_factory=dict)
+    csrf_token: str | None = None
+    alert: str | None = None        # Код ошибки const.ERR_* по найденному сообщению
+    alert_text: str | None = None
+
+    def as_dict(self):
+        """Формат, который исторически возвращал parse_counter_data (счётчики - Counter)."""
+        return {
+            "counters": self.counters,
+            "service_tokens": self.service_tokens
+        }
+
+
+@dataclass(frozen=True)
+class PageSignature:
+    """Подпись ответа: хеш первых length символов (без одноразовых токенов), после которых разбор завершился."""
+    length: int
+    digest: bytes
+
+
+@dataclass
+class SubmissionReply:
+    """Ответ портала на передачу показаний."""
+    accepted: bool | None           # None - в ответе нет сообщения портала
+    message: str | None = None
+
+
+def _has_class(attrs, name):
+    return name in (attrs.get("class") or "").split()
+
+
+def _normalize_text(parts):
+    """Текст элемента из фрагментов: пробельные символы схлопываются в один пробел."""
+    return " ".join("".join(parts).split())
+
+
+class _PageHandler:
+    """Обработчик событий разбора (start/end/data/close).
+
+    Интерфейс совпадает с target-парсером lxml, поэтому один и тот же обработчик
+    работает и с lxml, и со стандартным html.parser. Дерево документа не строится:
+    карточки, токены и сообщения собираются за один проход.
+    """
+
+    def __init__(self):
+        self.page = ParsedPage()
+        self._div_depth = 0
+        self._skip_text = 0
+        self._cards_seen = 0
+        self._card_depth = None     # Глубина div открытой карточки
+        self._counter = None        # Заполняемый счётчик (None для первой карточки)
+        self._strong = None         # Буфер текста первого <strong> в карточке
+        self._strong_done = False
+        self._h2 = None             # Буфер текста <h2> (ищем "№ ...")
+        self._fr_depth = None       # Глубина div.float-right
+        self._fr_text = None
+        self._fr_done = False
+        self._value_depth = None    # Глубина первого div внутри float-right
+        self._value_text = None
+        self._form_depth = 0        # Число открытых <form>
+        self._block_div = None      # Глубина открытого div.counters
+        self._cards_block = None    # Блок с карточками счётчиков: ("div", глубина) или ("form", уровень)
+        self.cards_closed = False   # Блок с карточками счётчиков закрылся
+        # Открытые div, текст которых ещё может начинаться с сообщения портала: [глубина, фрагменты]
+        self._alert_divs = []
+        self._alert_div = None      # div с найденным сообщением - дочитываем его текст
+
+    # --- события парсера ---
+    def start(self, tag, attrs):
+        if tag in _SKIP_TEXT_TAGS:
+            self._skip_text += 1
+            return
+        if tag == "div":
+            self._div_depth += 1
+            if self.page.alert is None:
+                self._alert_divs.append([self._div_depth, []])
+            if self._block_div is None and _has_class(attrs, CARDS_BLOCK_CLASS):
+                self._block_div = self._div_depth
+            self._start_div(attrs)
+        elif tag == "form":
+            self._form_depth += 1
+        elif tag == "br":
+            self._alert_text(" ")
+        elif tag == "input":
+            self._input(attrs)
+        elif tag == "meta":
+            if attrs.get("name") == CSRF_META_NAME and self.page.csrf_token is None:
+                self.page.csrf_token = attrs.get("content")
+        elif self._counter is not None:
+            if tag == "strong" and not self._strong_done and self._strong is None:
+                self._strong = []
+            elif tag == "h2" and self._counter.zavod_nomer is None and self._h2 is None:
+                self._h2 = []
+
+    def end(self, tag):
+        if tag in _SKIP_TEXT_TAGS:
+            if self._skip_text:
+                self._skip_text -= 1
+            return
+        if tag == "div":
+            if self._div_depth:
+                self._end_alert_div()
+                self._end_div()
+                if self._div_depth == self._block_div:
+                    self._block_div = None
+                    self._end_cards_block(("div", self._div_depth))
+                self._div_depth -= 1
+        elif tag == "form":
+            if self._form_depth:
+                self._end_cards_block(("form", self._form_depth))
+                self._form_depth -= 1
+        elif tag == "strong" and self._strong is not None:
+            counter_name = "".join(self._strong).strip()
+            if counter_name.endswith("."):
+                counter_name = counter_name[:-1]
+            self._counter.name = counter_name
+            self._strong = None
+            self._strong_done = True
+        elif tag == "h2" and self._h2 is not None:
+            h2_text = "".join(self._h2)
+            if "№" in h2_text:
+                self._counter.zavod_nomer = h2_text.split("№")[-1].strip()
+            self._h2 = None
+
+    def data(self, text):
+        if self._skip_text:
+            return
+        self._alert_text(text)
+        if self._counter is None:
+            return
+        # Текст копится как есть: при разборе частями он может прийти кусками, разрезанными
+        # посередине слова или по пробелу, - пробелы убираются при закрытии элемента
+        if self._strong is not None:
+            self._strong.append(text)
+        if self._h2 is not None:
+            self._h2.append(text)
+        if self._fr_text is not None:
+            self._fr_text.append(text)
+        if self._value_depth is not None:
+            self._value_text.append(text)
+
+    def close(self):
+        return self.page
+
+    # --- сообщения портала ---
+    @property
+    def alert_complete(self):
+        return self.page.alert is not None and self._alert_div is None
+
+    def _alert_text(self, text):
+        """Текст - во все открытые div; div решается, как только текста хватает для сравнения."""
+        if self._alert_div is not None:
+            self._alert_div[1].append(text)
+            return
+        if not self._alert_divs:
+            return
+        pending = []
+        for entry in self._alert_divs:
+            entry[1].append(text)
+            div_text = _normalize_text(entry[1])
+            if len(div_text) < _ALERT_PREFIX_LEN:
+                pending.append(entry)
+            elif self._match_alert(div_text):
+                self._alert_div = entry
+                return
+        self._alert_divs = pending
+
+    def _end_alert_div(self):
+        depth = self._div_depth
+        if self._alert_div is not None and self._alert_div[0] == depth:
+            self.page.alert_text = _normalize_text(self._alert_div[1])
+            self._alert_div = None
+        elif self._alert_divs and self._alert_divs[-1][0] == depth:
+            self._match_alert(_normalize_text(self._alert_divs.pop()[1]))
+
+    def _match_alert(self, div_text):
+        for message, code in ALERT_MESSAGES:
+            if div_text.startswith(message):
+                self.page.alert = code
+                self.page.alert_text = div_text
+                self._alert_divs = []
+                return True
+        return False
+
+    # --- карточки ---
+    def _start_div(self, attrs):
+        depth = self._div_depth
+        if self._card_depth is None:
+            if _has_class(attrs, "card"):
+                self._card_depth = depth
+                self._cards_seen += 1
+                if self._cards_seen > 1:  # Первая карточка - не счётчик
+                    self._start_cards_block()
+                    self._counter = Counter()
+                    self._strong_done = False
+                    self._fr_done = False
+            return
+        if self._counter is None:
+            return
+        if self._fr_depth is None:
+            if not self._fr_done and _has_class(attrs, "float-right"):
+                self._fr_depth = depth
+                self._fr_text = []
+        elif self._value_depth is None and self._value_text is None:
+            self._value_depth = depth
+            self._value_text = []
+
+    def _start_cards_block(self):
+        """Блок карточек - div.counters или форма, в которых открыта карточка счётчика.
+
+        Родитель карточки блоком не считается: карточки часто обёрнуты каждая в свою колонку.
+        """
+        if self._cards_block is not None and not self.cards_closed:
+            return
+        self.cards_closed = False
+        if self._block_div is not None:
+            self._cards_block = ("div", self._block_div)
+        elif self._form_depth:
+            self._cards_block = ("form", self._form_depth)
+        else:
+            self._cards_block = None
+
+    def _end_cards_block(self, block):
+        if block == self._cards_block:
+            self._cards_block = None
+            self.cards_closed = True
+
+    def _end_div(self):
+        depth = self._div_depth
+        if depth == self._value_depth:
+            self._value_depth = None    # Текст значения оставляем до закрытия float-right
+        elif depth == self._fr_depth:
+            if PREVIOUS_VALUE_LABEL in _normalize_text(self._fr_text):
+                self._fr_done = True
+                if self._value_text:
+                    match = _NUMBER_RE.search("".join(self._value_text))
+                    if match:
+                        self._counter.previous_value = match.group(0)
+            self._fr_depth = None
+            self._fr_text = None
+            self._value_text = None
+        elif depth == self._card_depth:
+            if self._counter is not None:
+                self.page.counters.append(self._counter)
+            self._counter = None
+            self._card_depth = None
+            self._strong = None
+            self._h2 = None
+            self._fr_depth = None
+            self._fr_text = None
+            self._value_depth = None
+            self._value_text = None
+
+    def _input(self, attrs):
+        name = attrs.get("name")
+        if not name:
+            return
+        value = attrs.get("value") or ""
+        if self._counter is not None:
+            self._counter.add_field(name, value, hidden=(attrs.get("type") or "text").lower() == "hidden")
+        if name in SERVICE_TOKEN_NAMES and name not in self.page.service_tokens:
+            self.page.service_tokens[name] = attrs.get("value")
+
+
+class _StdlibDriver(HTMLParser):
+    """Передаёт события html.parser в _PageHandler."""
+
+    def __init__(self, handler):
+        super().__init__(convert_charrefs=True)
+        self._handler = handler
+
+    def handle_starttag(self, tag, attrs):
+        self._handler.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self._handler.end(tag)
+
+    def handle_data(self, data):
+        self._handler.data(data)
+
+    def close(self):
+        super().close()
+        return self._handler.close()
+
+
+@functools.cache
+def _lxml_parser_factory():
+    """lxml (если установлен) разбирает тот же поток событий заметно быстрее html.parser.
+
+    Импортируется при первом разборе, а не при импорте модуля.
+    """
+    try:
+        from lxml import etree
+    except ImportError:
+        return None
+
+    def factory(handler):
+        return etree.HTMLParser(target=handler)
+    return factory
+
+
+class PageParser:
+    """Потоковый парсер страницы: feed() частями, close() возвращает ParsedPage.
+
+    complete становится True, когда дальше документ можно не читать: для STOP_AFTER_CARDS -
+    найдено сообщение портала или закрылся блок карточек (div.counters или форма с
+    карточками) и lk_add_value_token уже найден; без такого блока страница читается до
+    конца. Для STOP_AFTER_TOKENS - найдены оба токена.
+    """
+
+    def __init__(self, use_lxml: bool = True, stop: str | None = None):
+        self._handler = _PageHandler()
+        self._stop = stop
+        lxml_factory = _lxml_parser_factory() if use_lxml else None
+        if lxml_factory is not None:
+            self._parser = lxml_factory(self._handler)
+        else:
+            self._parser = _StdlibDriver(self._handler)
+        self._fed = False
+
+    def feed(self, text: str):
+        if text:
+            self._fed = True
+            self._parser.feed(text)
+
+    @property
+    def complete(self) -> bool:
+        page = self._handler.page
+        if self._stop == STOP_AFTER_CARDS:
+            if page.alert is not None:
+                # Текст сообщения (для журнала) дочитывается до закрытия его div
+                return self._handler.alert_complete
+            return self._handler.cards_closed and all(name in page.service_tokens for name in SERVICE_TOKEN_NAMES)
+        if self._stop == STOP_AFTER_TOKENS:
+            return page.csrf_token is not None and all(name in page.service_tokens for name in SERVICE_TOKEN_NAMES)
+        return False
+
+    def close(self) -> ParsedPage:
+        if not self._fed:
+            # lxml не умеет закрывать пустой документ
+            return self._handler.close()
+        return self._parser.close()
+
+
+class _Fingerprint:
+    """Инкрементальный blake2b текста ответа; токены lk_add_value_token и csrf-мета заменены заглушкой.
+
+    Тег, разрезанный границей частей, хешируется целиком со следующей частью, поэтому
+    хеш не зависит от того, как ответ пришёл по сети. digest_at(limit) - хеш первых
+    limit символов (без токенов), как только их набралось.
+    """
+
+    def __init__(self, limit: int | None = None):
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._tail = ""
+        self.length = 0
+        self.limit = limit
+        self.limit_digest = None
+
+    def feed(self, text: str):
+        text = self._tail + text
+        cut = text.rfind("<")
+        if cut >= 0 and text.find(">", cut) < 0 and len(text) - cut <= _MAX_TAG_LEN:
+            text, self._tail = text[:cut], text[cut:]
+        else:
+            self._tail = ""
+        text = _VOLATILE_RE.sub(_VOLATILE_PLACEHOLDER, text)
+        if self.limit_digest is None and self.limit is not None and self.length + len(text) >= self.limit:
+            prefix = self._hash.copy()
+            prefix.update(text[:self.limit - self.length].encode())
+            self.limit_digest = prefix.digest()
+        self._hash.update(text.encode())
+        self.length += len(text)
+
+    def signature(self) -> PageSignature:
+        return PageSignature(self.length, self._hash.digest())
+
+
+class SignedPageParser:
+    """PageParser, который подписывает прочитанный текст и не разбирает повторный ответ.
+
+    previous - подпись прошлого ответа, разбор которого завершился досрочно (complete). Пока
+    не прочитано previous.length символов, текст только хешируется и копится. Если хеш совпал,
+    страница та же: разбор не нужен (unchanged, close() возвращает None), из накопленного
+    текста берётся только новый lk_add_value_token. Иначе накопленное передаётся парсеру и
+    разбор продолжается как обычно; signature - подпись нового ответа для следующего раза.
+    """
+
+    def __init__(self, previous: PageSignature | None = None, use_lxml: bool = True, stop: str | None = None):
+        self._parser = PageParser(use_lxml=use_lxml, stop=stop)
+        self._fingerprint = _Fingerprint(previous.length if previous is not None else None)
+        self._previous = previous
+        self._buffer = [] if previous is not None else None
+        self.unchanged = False
+        self.service_token = None
+
+    def feed(self, text: str):
+        if self.unchanged or not text:
+            return
+        self._fingerprint.feed(text)
+        if self._buffer is None:
+            self._parser.feed(text)
+            return
+        self._buffer.append(text)
+        digest = self._fingerprint.limit_digest
+        if digest is None:
+            return
+        if digest == self._previous.digest:
+            self.unchanged = True
+            self.service_token = find_service_token("".join(self._buffer))
+        else:
+            self._flush()
+
+    def _flush(self):
+        buffered, self._buffer = "".join(self._buffer), None
+        self._parser.feed(buffered)
+
+    @property
+    def complete(self) -> bool:
+        return self.unchanged or self._parser.complete
+
+    @property
+    def signature(self) -> PageSignature | None:
+        """Подпись ответа, если разбор завершился досрочно (иначе повтор пришлось бы читать до конца)."""
+        return self._fingerprint.signature() if self._parser.complete else None
+
+    def close(self) -> ParsedPage | None:
+        if self.unchanged:
+            return None
+        if self._buffer is not None:
+            self._flush()
+        return self._parser.close()
+
+
+def parse_page(html_content: str, use_lxml: bool = True) -> ParsedPage:
+    """Разбирает страницу counters.php за один проход."""
+    parser = PageParser(use_lxml=use_lxml)
+    parser.feed(html_content)
+    return parser.close()
+
+
+def find_service_token(html_content: str) -> str | None:
+    """lk_add_value_token из ответа без полного разбора страницы."""
+    tag = _TOKEN_INPUT_RE.search(html_content)
+    if tag is None:
+        return None
+    value = _VALUE_ATTR_RE.search(tag.group(0))
+    if value is None:
+        return None
+    return next(group for group in value.groups() if group is not None)
+
+
+def parse_submission_reply(html_content: str) -> SubmissionReply:
+    """Принято ли показание: по сообщению портала (при нескольких сообщениях отказ важнее)."""
+    reply = SubmissionReply(None)
+    for kind, body in _REPLY_ALERT_RE.findall(html_content):
+        message = " ".join(_TAG_RE.sub(" ", body).split())
+        if kind.lower() == "success":
+            if reply.accepted is None:
+                reply = SubmissionReply(True, message)
+        else:
+            return SubmissionReply(False, message)
+    return reply
+
+
+def redact_tokens(html_content: str) -> str:
+    """Страница без значений lk_add_value_token и csrf-меты (для диагностики)."""
+    html_content = _TOKEN_INPUT_RE.sub(
+        lambda tag: _VALUE_ATTR_RE.sub(f'value="{REDACTED}"', tag.group(0)), html_content
+    )
+    return _CSRF_META_RE.sub(
+        lambda tag: _CONTENT_ATTR_RE.sub(f'content="{REDACTED}"', tag.group(0)), html_content
+    )
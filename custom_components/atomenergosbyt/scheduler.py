@@ -0,0 +1,59 @@
+## Расписание опроса с учётом периода приёма показаний (5–25 число)
+
+import zlib
+from datetime import datetime, timedelta
+from . import const
+
+WINDOW_FIRST_DAY = 5
+WINDOW_LAST_DAY = 25
+
+WINDOW_INTERVAL = const.DEFAULT_SCAN_INTERVAL   # Внутри периода приёма показаний
+DATE_POK_INTERVAL = timedelta(minutes=15)       # Сразу после передачи показаний (смена DatePok)
+DATE_POK_NEAR = timedelta(days=1)
+HEARTBEAT_INTERVAL = timedelta(hours=12)        # Вне периода - редкая проверка доступности
+MIN_INTERVAL = timedelta(minutes=5)
+
+JITTER_FRACTION = 0.1                           # ±10% интервала
+WINDOW_OPEN_SPREAD = timedelta(minutes=30)      # Разброс первых опросов после открытия периода
+
+
+def in_submission_window(now: datetime) -> bool:
+    return WINDOW_FIRST_DAY <= now.day <= WINDOW_LAST_DAY
+
+
+def next_window_open(now: datetime) -> datetime:
+    """Начало ближайшего периода приёма показаний (00:00 5-го числа)."""
+    opening = now.replace(day=WINDOW_FIRST_DAY, hour=0, minute=0, second=0, microsecond=0)
+    if now.day >= WINDOW_FIRST_DAY:
+        # 5-е число следующего месяца: от 28-го числа +4 дня всегда попадают в следующий месяц
+        opening = (opening.replace(day=28) + timedelta(days=4)).replace(day=WINDOW_FIRST_DAY)
+    return opening
+
+
+def account_phase(ls_number: str) -> float:
+    """Постоянная для лицевого счёта доля [0, 1): разносит опросы разных записей во времени."""
+    return (zlib.crc32(str(ls_number).encode()) % 1000) / 1000
+
+
+def next_update_interval(now: datetime, ls_number: str, last_date_pok: datetime | None = None,
+                         period_closed: bool = False) -> timedelta:
+    """Интервал до следующего опроса лицевого счёта.
+
+    - в период 5–25: WINDOW_INTERVAL, а в течение суток после смены DatePok - DATE_POK_INTERVAL;
+    - вне периода (или если портал ответил, что период закрыт): HEARTBEAT_INTERVAL, но не позже
+      открытия следующего периода (со сдвигом до WINDOW_OPEN_SPREAD по лицевому счёту);
+    - к интервалу добавляется постоянный для лицевого счёта джиттер ±JITTER_FRACTION.
+    """
+    phase = account_phase(ls_number)
+
+    if in_submission_window(now) and not period_closed:
+        if last_date_pok is not None and timedelta(0) <= now - last_date_pok <= DATE_POK_NEAR:
+            interval = DATE_POK_INTERVAL
+        else:
+            interval = WINDOW_INTERVAL
+        interval *= 1 + JITTER_FRACTION * (2 * phase - 1)
+        return max(interval, MIN_INTERVAL)
+
+    until_open = next_window_open(now) + WINDOW_OPEN_SPREAD * phase - now
+    interval = HEARTBEAT_INTERVAL * (1 + JITTER_FRACTION * (2 * phase - 1))
+    return max(min(interval, until_open), MIN_INTERVAL)
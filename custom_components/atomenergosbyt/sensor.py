@@ -1,182 +1,409 @@
-import re
+import dataclasses
+import functools
+import logging
+from collections.abc import Callable
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any
 from homeassistant.helpers.entity import Entity
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import DiscoveryInfoType
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import (
+    SensorDeviceClass,
+    SensorEntity,
+    SensorEntityDescription,
+    SensorStateClass,
+)
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
-from .const import DOMAIN, CONF_LS_NUMBER, CONF_COUNTERS_DATA
-from .atomsbt_lib import AtomEnergoSender, custom_log
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.const import (
+    EntityCategory, UnitOfEnergy, UnitOfInformation, UnitOfTime, UnitOfVolume,
+)
+from homeassistant.helpers.restore_state import RestoreEntity
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from homeassistant.util import dt as dt_util
+from .const import DOMAIN, CONF_LS_NUMBER, CONF_COUNTERS, DATA_COORDINATOR
+from .consumption import billing_period_start, month_start
+from .history import ReadingHistory, _unit_of_measurement
+from .metrics import PHASE_CHECK_LS, PHASE_SEND
+from .models import parse_number
+
+_LOGGER = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, kw_only=True)
+class AtomCounterDescription(SensorEntityDescription):
+    """Тип сенсора счётчика по началу названия услуги на карточке."""
+    prefix: str
+
+
+# Типы счётчиков (строится один раз при импорте); key - тип в имени и unique_id сенсора
+COUNTER_SENSORS = (
+    AtomCounterDescription(
+        key="cold_water",
+        prefix="Холодное водоснабжение",
+        device_class=SensorDeviceClass.WATER,
+        native_unit_of_measurement=UnitOfVolume.CUBIC_METERS,
+    ),
+    AtomCounterDescription(
+        key="warm_water",
+        prefix="Горячее водоснабжение",
+        device_class=SensorDeviceClass.WATER,
+        native_unit_of_measurement=UnitOfVolume.CUBIC_METERS,
+    ),
+    AtomCounterDescription(
+        key="electro",
+        prefix="Электроснабжение",
+        device_class=SensorDeviceClass.ENERGY,
+        native_unit_of_measurement=UnitOfEnergy.KILO_WATT_HOUR,
+    ),
+)
+UNKNOWN_COUNTER = AtomCounterDescription(
+    key="unknown", prefix="", device_class="measurement", native_unit_of_measurement="unit"
+)
 
 # Маппинг для определения типа сенсора по имени
-SENSOR_NAME_MAP = {
-    "Холодное водоснабжение": "cold_water",
-    "Горячее водоснабжение": "warm_water",
-    "Электроснабжение": "electro",
-}
+SENSOR_NAME_MAP = {description.prefix: description.key for description in COUNTER_SENSORS}
+
+
+@functools.cache
+def counter_description(name):
+    """Описание сенсора по названию счётчика (одно на название)."""
+    name = (name or "").strip()
+    for description in COUNTER_SENSORS:
+        if name.startswith(description.prefix):
+            return description
+    # Неизвестная услуга: единицы - по слову в названии, как и прежде
+    unit = _unit_of_measurement(name)
+    if unit is None:
+        return UNKNOWN_COUNTER
+    return dataclasses.replace(
+        UNKNOWN_COUNTER,
+        device_class=SensorDeviceClass.ENERGY if unit == UnitOfEnergy.KILO_WATT_HOUR else SensorDeviceClass.WATER,
+        native_unit_of_measurement=unit,
+    )
 
 async def async_setup_entry(hass, config_entry, async_add_entities):
-    """Настройка сенсоров при создании записи конфигурации."""
+    """Настройка сенсоров при создании записи конфигурации.
+
+    Сенсоры создаются по счётчикам, сохранённым в записи (без запроса к порталу); счётчики,
+    впервые появившиеся в ответе портала, добавляются после обновления координатора.
+    """
     # Получаем данные из конфигурации
-    custom_log(f"async_setup_entry::start")
+    _LOGGER.debug("async_setup_entry::start")
     data = hass.data[DOMAIN][config_entry.entry_id]
     ls_number = data[CONF_LS_NUMBER]
-    counters_data = data[CONF_COUNTERS_DATA].get("counters", {})
-    custom_log(f"async_setup_entry:: ls_number [{ls_number}]")
-
-    sensors = []
-    #for counter_id, counter_info in counters_data.items():
-    for counter_info in counters_data:
-        name = counter_info.get("name", "").strip()
-        previous_value = counter_info.get("previous_value")
-        zavod_nomer = counter_info.get("zavod_nomer")
-        fields = counter_info.get("fields", [])
-        counter_id = "0"
-        last_date_readings = ""
-        check_avg = ""
-        tarifnost = ""
-        service_number = ""
-        tariff_name = ""
-        if fields:
-            counter_id = _extract_counter_id_from_fields(fields)
-            last_date_readings = _extract_value_from_fields(fields, "DatePok")
-            check_avg = _extract_value_from_fields(fields, "check_avg")
-            tarifnost = _extract_value_from_fields(fields, "Tarifnost")
-            service_number = _extract_value_from_fields(fields, "NomerUslugi")
-            tariff_name = _extract_value_from_fields(fields, "NazvanieTarifa")
-            
-        # Определяем тип сенсора по ключевому слову в name
-        sensor_type = "unknown"
-        for prefix, sensor_key in SENSOR_NAME_MAP.items():
-            if name.startswith(prefix):
-                sensor_type = sensor_key
-                break
-
-        # Создаём сенсор с уникальным ID на основе ID счётчика
-        custom_log(f"async_setup_entry:: sensors.append(AtomCounterSensor) ls_number [{ls_number}], counter_id [{counter_id}], counter_name [{name}], sensor_type [{sensor_type}], state [{previous_value}], last_date_readings [{last_date_readings}], check_avg [{check_avg}], tarifnost [{tarifnost}], service_number {[service_number]}, tariff_name [{tariff_name}], zavod_nomer [{zavod_nomer}]")
-        sensors.append(AtomCounterSensor(
-            ls_number=ls_number,
-            counter_id=counter_id,
-            counter_name=name,
-            sensor_type=sensor_type,
-            state=previous_value,
-            last_date_readings=last_date_readings,
-            check_avg=check_avg,
-            tarifnost=tarifnost,
-            service_number=service_number,
-            tariff_name=tariff_name,
-            zavod_nomer=zavod_nomer
-        ))
-
-    async_add_entities(sensors)
-
-def _extract_counter_id_from_fields(fields):
-    """Извлекаем ID счетчика из поля в fields, если оно присутствует."""
-    # Регулярное выражение для извлечения ID из строки
-    pattern = r"counters\[(\d+)\]"
-    
-    for field in fields:
-        # Если поле - строка, пытаемся найти ID в самой строке
-        if isinstance(field, str):
-            match = re.search(pattern, field)
-            if match:
-                return match.group(1)  # Извлекаем номер ID и возвращаем его
-        
-        # Если поле - словарь, пытаемся найти 'field_name' и извлекаем ID из него
-        elif isinstance(field, dict):
-            match = re.search(pattern, field.get("field_name", ""))
-            if match:
-                return match.group(1)  # Извлекаем номер ID и возвращаем его
-    return None
-    
-def _extract_value_from_fields(fields, value):
-    """Ищет в fields элемент с [DatePok] и извлекает значение после него."""
-    date_pok_values = []
-    # Проходим по всем полям
-    for field in fields:
-        # Проверяем, если имя поля заканчивается на '[DatePok]'
-        match = re.search(rf"\[{value}\]$", field)
-        if match:
-            # Если найдено, добавляем соответствующее значение в список
-            date_pok_values.append(fields[field])  # предполагаем, что значение находится в поле с таким именем
-    # Возвращаем все найденные значения или None, если ничего не найдено
-    return date_pok_values if date_pok_values else None
-
-class AtomCounterSensor(SensorEntity):
-    """Сенсор для счетчиков."""
-    
-    def __init__(self, ls_number, counter_id, counter_name, sensor_type, state, last_date_readings, check_avg, tarifnost, service_number, tariff_name, zavod_nomer):
+    coordinator = data[DATA_COORDINATOR]
+    _LOGGER.debug("async_setup_entry:: ls_number [%s]", ls_number)
+    known_ids = set()
+
+    def _create_sensors(counters):
+        sensors = []
+        for counter in counters:
+            if counter["id"] is None or counter["id"] in known_ids:
+                continue
+            known_ids.add(counter["id"])
+            description = counter_description(counter["name"])
+
+            # Создаём сенсор с уникальным ID на основе ID счётчика
+            _LOGGER.debug("async_setup_entry:: sensors.append(AtomCounterSensor) ls_number [%s], sensor_type [%s], counter [%s]", ls_number, description.key, counter)
+            sensors.append(AtomCounterSensor(
+                coordinator=coordinator,
+                ls_number=ls_number,
+                counter_id=counter["id"],
+                description=description,
+                zavod_nomer=counter["zavod_nomer"],
+            ))
+            sensors.extend(
+                AtomConsumptionSensor(coordinator, ls_number, counter, description.key, consumption)
+                for consumption in CONSUMPTION_SENSORS
+            )
+        if sensors:
+            async_add_entities(sensors)
+
+    @callback
+    def _async_add_new_counters():
+        _create_sensors(counter.as_entry_data() for counter in (coordinator.data or {}).get("counters", []))
+
+    _create_sensors(config_entry.data.get(CONF_COUNTERS, []))
+    config_entry.async_on_unload(coordinator.async_add_listener(_async_add_new_counters))
+    async_add_entities(AtomDiagnosticSensor(coordinator, ls_number, description) for description in DIAGNOSTIC_SENSORS)
+
+def _counter_reading(counter_info):
+    """Показание (числом) и поля карточки счётчика (Counter) в порядке READING_ATTRIBUTES."""
+    return (
+        counter_info.previous_reading,
+        counter_info.date_pok,
+        counter_info.check_avg,
+        counter_info.tarifnost,
+        counter_info.service_number,
+        counter_info.tariff_name,
+    )
+
+# Атрибуты состояния из карточки (после показания); по ним же показания восстанавливаются после перезапуска
+READING_ATTRIBUTES = (
+    "Дата последней передачи показаний",
+    "CheckAVG",
+    "Tarifnost",
+    "Номер услуги",
+    "Наименование тарифа",
+)
+
+class AtomCounterSensor(CoordinatorEntity, RestoreEntity, SensorEntity):
+    """Сенсор для счетчиков.
+
+    Имя, unique_id и описание задаются один раз; атрибуты - неизменяемый словарь, который
+    пересобирается только при изменении карточки. Состояние не записывается, если ни
+    показание, ни доступность не изменились.
+    """
+    entity_description: AtomCounterDescription
+
+    def __init__(self, coordinator, ls_number, counter_id, description, zavod_nomer):
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._attr_name = f"atomsbt_{ls_number}_{description.key}_{counter_id}"
+        self._attr_unique_id = self._attr_name
         self._ls_number = ls_number
         self._counter_id = counter_id
-        self._sensor_type = sensor_type
-        self._state = state
-        self._last_date_readings = last_date_readings
-        self._check_avg = check_avg
-        self._tarifnost = tarifnost
-        self._service_number = service_number
-        self._tariff_name = tariff_name
-        self._sensor_name = self._get_sensor_name(counter_name)
-        self._unit_of_measurement = self._get_unit_of_measurement(counter_name)
-        self._device_class = self._get_device_class(counter_name)
-
-    def _get_sensor_name(self, name):
-        """Определение типа сенсора по имени счетчика."""
-        for key, value in SENSOR_NAME_MAP.items():
-            if name.startswith(key):
-                return value
-        return "unknown"
-
-    def _get_unit_of_measurement(self, name):
-        """Устанавливаем единицы измерения в зависимости от типа счетчика."""
-        if "Электроснабжение" in name:
-            return "kWh"
-        elif "водоснабжение" in name:
-            return "m³"
-        return "unit"
-
-    def _get_device_class(self, name):
-        """Устанавливаем тип устройства в зависимости от типа счетчика."""
-        if "Электроснабжение" in name:
-            return "energy"
-        elif "водоснабжение" in name:
-            return "water"
-        return "measurement"
-       
+        self._zavod_nomer = zavod_nomer
+        self._reading = None
+        self._written = None    # (показание, доступность) последней записи состояния
+        self._set_reading((None,) * (len(READING_ATTRIBUTES) + 1))
+
+    async def async_added_to_hass(self):
+        """До первого ответа портала показываем последнее сохранённое состояние."""
+        await super().async_added_to_hass()
+        if self._update_from_coordinator() is not None:
+            return
+        last_state = await self.async_get_last_state()
+        # Прежние версии записывали "Не найден" вместо показания - такое состояние не восстанавливается
+        value = parse_number(last_state.state) if last_state is not None else None
+        if value is None:
+            return
+        self._set_reading((value, *(last_state.attributes.get(attribute) for attribute in READING_ATTRIBUTES)))
+
+    def _set_reading(self, reading):
+        """Новые показание и поля карточки; True, если они изменились (атрибуты пересобираются)."""
+        if reading == self._reading:
+            return False
+        self._reading = reading
+        self._attr_extra_state_attributes = MappingProxyType({
+            "Лицевой счет": self._ls_number,
+            "ID счетчика": self._counter_id,
+            "Заводской номер": self._zavod_nomer,
+            READING_ATTRIBUTES[0]: reading[1],
+            "Последние показания": reading[0],
+            **dict(zip(READING_ATTRIBUTES[1:], reading[2:])),
+        })
+        return True
+
+    def _update_from_coordinator(self):
+        """Показания счётчика из последнего результата разбора страницы.
+
+        Возвращает None, если счётчика там нет, иначе - изменились ли показания.
+        """
+        counter_info = self.coordinator.counter(self._counter_id)
+        if counter_info is None:
+            return None
+        return self._set_reading(_counter_reading(counter_info))
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Обновляем показания из свежего результата разбора страницы (без записи, если ничего не изменилось)."""
+        self._update_from_coordinator()
+        written = (self._reading, self.available)
+        if written != self._written:
+            self._written = written
+            self.async_write_ha_state()
+
+    @property
+    def native_value(self):
+        """Последнее показание числом; None, пока счётчика нет в ответе портала."""
+        return self._reading[0]
+
+
+@dataclass(frozen=True, kw_only=True)
+class AtomConsumptionDescription(SensorEntityDescription):
+    """Сенсор потребления: значение из ряда показаний счётчика (CounterSeries)."""
+    value_fn: Callable[[Any, Any], float | None]
+    per_day: bool = False
+    # Начало периода, за который накоплено значение (для state_class TOTAL)
+    last_reset_fn: Callable[[Any], Any] | None = None
+
+
+CONSUMPTION_SENSORS = (
+    AtomConsumptionDescription(
+        key="daily",
+        state_class=SensorStateClass.MEASUREMENT,
+        per_day=True,
+        value_fn=lambda series, now: series.daily,
+    ),
+    AtomConsumptionDescription(
+        key="month",
+        state_class=SensorStateClass.TOTAL,
+        value_fn=lambda series, now: series.month_total(now),
+        last_reset_fn=month_start,
+    ),
+    AtomConsumptionDescription(
+        key="billing_period",
+        state_class=SensorStateClass.TOTAL,
+        value_fn=lambda series, now: series.period_total(now),
+        last_reset_fn=billing_period_start,
+    ),
+    AtomConsumptionDescription(
+        key="average",
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda series, now: series.rolling_average(now),
+    ),
+)
+
+
+class AtomConsumptionSensor(CoordinatorEntity, SensorEntity):
+    """Потребление по счётчику: за сутки (среднее), месяц, расчётный период, скользящее среднее.
+
+    Значения за месяц и период пересчитываются и полуночным таймером координатора.
+    """
+
+    _attr_suggested_display_precision = 2
+
+    def __init__(self, coordinator, ls_number, counter, sensor_type, description: AtomConsumptionDescription):
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._counter_id = counter["id"]
+        self._history_key = ReadingHistory.key(counter["zavod_nomer"], counter["id"])
+        unit = _unit_of_measurement(counter["name"])
+        self._attr_native_unit_of_measurement = f"{unit}/d" if unit and description.per_day else unit
+        self._attr_name = f"atomsbt_{ls_number}_{sensor_type}_{counter['id']}_{description.key}"
+        self._attr_unique_id = self._attr_name
+        self._written = None    # (значение, начало периода, атрибуты, доступность) последней записи состояния
+
+    @callback
+    def _handle_coordinator_update(self):
+        """Координатор вызывает слушателей после каждого опроса - пишем состояние, только если оно изменилось."""
+        written = (self.native_value, self.last_reset, self.extra_state_attributes, self.available)
+        if written != self._written:
+            self._written = written
+            self.async_write_ha_state()
+
     @property
-    def name(self):
-        """Имя сенсора."""
-        return f"atomsbt_{self._ls_number}_{self._sensor_name}_{self._counter_id}"
+    def available(self):
+        # Ряд показаний хранится локально и не зависит от доступности портала
+        return self.coordinator.consumption.get(self._history_key) is not None
 
     @property
-    def unique_id(self):
-        """Уникальный идентификатор сенсора."""
-        return f"atomsbt_{self._ls_number}_{self._sensor_name}_{self._counter_id}"
+    def last_reset(self):
+        if self.entity_description.last_reset_fn is None:
+            return None
+        return self.entity_description.last_reset_fn(dt_util.now())
 
     @property
-    def state(self):
-        """Состояние сенсора (значение счетчика)."""
-        return self._state or "Не найден"
+    def native_value(self):
+        series = self.coordinator.consumption.get(self._history_key)
+        if series is None:
+            return None
+        value = self.entity_description.value_fn(series, dt_util.now())
+        return round(value, 3) if value is not None else None
 
     @property
     def extra_state_attributes(self):
-        """Возвращаем дополнительные атрибуты для сенсора."""
-        return {
-            "Лицевой счет": self._ls_number,
-            "ID счетчика": self._counter_id,
-            "Дата последней передачи показаний": self._last_date_readings,
-            "Последние показания": self._state,
-            "CheckAVG": self._check_avg,
-            "Tarifnost": self._tarifnost,
-            "Номер услуги": self._service_number,
-            "Наименование тарифа": self._tariff_name,
-        }
+        if self.entity_description.key != "average":
+            return None
+        # Сравнение со средним потреблением, которое передаёт портал (check_avg)
+        counter = self.coordinator.counter(self._counter_id)
+        check_avg = counter.average_consumption if counter is not None else None
+        value = self.native_value
+        deviation = None
+        if check_avg and value is not None:
+            deviation = round((value - check_avg) / check_avg * 100, 1)
+        return {"check_avg": check_avg, "deviation_percent": deviation}
+
+
+@dataclass(frozen=True, kw_only=True)
+class AtomDiagnosticDescription(SensorEntityDescription):
+    """Диагностический сенсор: значение и атрибуты из снимка метрик координатора (coordinator.diagnostics)."""
+    value_fn: Callable[[Any], Any]
+    attributes_fn: Callable[[Any], dict] | None = None
+
+
+def _phase_attributes(phase):
+    def attributes(diagnostics):
+        stats = diagnostics["phases"][phase]
+        return {key: stats[key] for key in ("count", "avg_ms", "p95_ms", "max_ms", "histogram_ms")}
+    return attributes
+
+
+def _cache_attributes(diagnostics):
+    return {
+        f"{name}_{kind}": value
+        for name, counts in diagnostics["cache"].items()
+        for kind, value in counts.items()
+    }
+
+
+DIAGNOSTIC_SENSORS = (
+    AtomDiagnosticDescription(
+        key="check_ls_latency",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda diagnostics: diagnostics["phases"][PHASE_CHECK_LS]["last_ms"],
+        attributes_fn=_phase_attributes(PHASE_CHECK_LS),
+    ),
+    AtomDiagnosticDescription(
+        key="check_ls_size",
+        device_class=SensorDeviceClass.DATA_SIZE,
+        native_unit_of_measurement=UnitOfInformation.BYTES,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda diagnostics: diagnostics["phases"][PHASE_CHECK_LS]["last_bytes"],
+        attributes_fn=_cache_attributes,
+    ),
+    AtomDiagnosticDescription(
+        key="send_latency",
+        device_class=SensorDeviceClass.DURATION,
+        native_unit_of_measurement=UnitOfTime.MILLISECONDS,
+        state_class=SensorStateClass.MEASUREMENT,
+        value_fn=lambda diagnostics: diagnostics["phases"][PHASE_SEND]["last_ms"],
+        attributes_fn=_phase_attributes(PHASE_SEND),
+    ),
+    AtomDiagnosticDescription(
+        key="errors",
+        state_class=SensorStateClass.TOTAL_INCREASING,
+        value_fn=lambda diagnostics: sum(diagnostics["errors"].values()),
+        attributes_fn=lambda diagnostics: diagnostics["errors"],
+    ),
+    AtomDiagnosticDescription(
+        key="portal_state",
+        device_class=SensorDeviceClass.ENUM,
+        options=["closed", "open", "half_open"],
+        value_fn=lambda diagnostics: diagnostics["portal_state"],
+        attributes_fn=lambda diagnostics: {"retry_after": diagnostics["retry_after"]},
+    ),
+)
+
+
+class AtomDiagnosticSensor(CoordinatorEntity, SensorEntity):
+    """Метрики запросов к порталу по лицевому счёту (по умолчанию отключены)."""
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, coordinator, ls_number, description: AtomDiagnosticDescription):
+        super().__init__(coordinator)
+        self.entity_description = description
+        self._attr_name = f"atomsbt_{ls_number}_{description.key}"
+        self._attr_unique_id = f"atomsbt_{ls_number}_{description.key}"
 
     @property
-    def device_class(self):
-        """Тип устройства (класс)."""
-        return self._device_class
+    def available(self):
+        # Метрики есть и тогда, когда портал недоступен
+        return True
 
     @property
-    def unit_of_measurement(self):
-        """Единицы измерения."""
-        return self._unit_of_measurement
\ No newline at end of file
+    def native_value(self):
+        return self.entity_description.value_fn(self.coordinator.diagnostics)
+
+    @property
+    def extra_state_attributes(self):
+        if self.entity_description.attributes_fn is None:
+            return None
+        return self.entity_description.attributes_fn(self.coordinator.diagnostics)
@@ -0,0 +1,72 @@
+## Сервисы интеграции
+
+import logging
+import voluptuous as vol
+import homeassistant.helpers.config_validation as cv
+from homeassistant.core import HomeAssistant, ServiceCall, SupportsResponse
+from homeassistant.exceptions import HomeAssistantError
+from . import const
+
+_LOGGER = logging.getLogger(__name__)
+
+SEND_READINGS_SCHEMA = vol.Schema({
+    vol.Required(const.CONF_LS_NUMBER): cv.string,
+    vol.Required(const.ATTR_READINGS): vol.All(cv.ensure_list, [vol.Schema({
+        vol.Required(const.ATTR_COUNTER_ID): cv.string,
+        vol.Required(const.ATTR_VALUES): vol.All(cv.ensure_list, [vol.Coerce(float)]),
+    })]),
+    vol.Optional(const.ATTR_SKIP_VALIDATION, default=False): cv.boolean,
+})
+
+
+def _find_coordinator(hass: HomeAssistant, ls_number: str):
+    for data in hass.data.get(const.DOMAIN, {}).values():
+        if isinstance(data, dict) and data.get(const.CONF_LS_NUMBER) == ls_number:
+            return data[const.DATA_COORDINATOR]
+    raise HomeAssistantError(f"Лицевой счет {ls_number} не зарегистрирован в интеграции")
+
+
+async def async_setup_services(hass: HomeAssistant):
+    """Регистрация сервисов (один раз на домен)."""
+
+    async def async_send_readings(call: ServiceCall):
+        """Передача показаний по всем счетчикам и тарифным зонам лицевого счета одним запросом."""
+        ls_number = call.data[const.CONF_LS_NUMBER]
+        coordinator = _find_coordinator(hass, ls_number)
+        if coordinator.data is None:
+            # Портал ещё не опрашивался после запуска - нужны актуальные поля карточек
+            await coordinator.async_refresh()
+        counters = {counter.id: counter for counter in (coordinator.data or {}).get("counters", [])}
+
+        results = {}
+        batch = []
+        for reading in call.data[const.ATTR_READINGS]:
+            reading_counter_id = reading[const.ATTR_COUNTER_ID]
+            values = reading[const.ATTR_VALUES]
+            counter = counters.get(reading_counter_id)
+            if counter is None:
+                results[reading_counter_id] = {"accepted": False, "reason": const.REASON_UNKNOWN_COUNTER, "message": None}
+            else:
+                batch.append((counter, values))
+
+        if batch:
+            # Проверка показаний (зоны, значения) - в клиенте; неверные не отправляются
+            sent = await coordinator.sender.async_send_readings(
+                batch, check_plausibility=not call.data[const.ATTR_SKIP_VALIDATION]
+            )
+            results.update((sent_counter_id, result.as_dict()) for sent_counter_id, result in sent.items())
+            # Принятые (и неподтверждённые) показания меняют карточки счётчиков
+            if any(result.accepted is not False for result in sent.values()):
+                await coordinator.async_request_refresh()
+
+        _LOGGER.info("Передача показаний по ЛС %s: %s", ls_number, results)
+        return {"results": results}
+
+    if not hass.services.has_service(const.DOMAIN, const.SERVICE_SEND_READINGS):
+        hass.services.async_register(
+            const.DOMAIN,
+            const.SERVICE_SEND_READINGS,
+            async_send_readings,
+            schema=SEND_READINGS_SCHEMA,
+            supports_response=SupportsResponse.OPTIONAL,
+        )